@@ -36,7 +36,7 @@ from __future__ import division
 __version__ = "$Revision$"
 # $HeadURL$
 
-from operator import isCallable
+from operator import isCallable, itemgetter
 from state import observed, reversible_pair, reversible_property
 
 # epsilon for float comparison
@@ -62,6 +62,8 @@ class Variable(object):
     a float variable.
     """
 
+    __slots__ = ('_value', '_strength', '_solver', '_constraints', '__weakref__')
+
     def __init__(self, value=0.0, strength=NORMAL):
         self._value = float(value)
         self._strength = strength
@@ -70,6 +72,12 @@ class Variable(object):
         self._solver = None
         self._constraints = set()
 
+    def __getstate__(self):
+        return self._value, self._strength, self._solver, self._constraints
+
+    def __setstate__(self, state):
+        self._value, self._strength, self._solver, self._constraints = state
+
     @observed
     def _set_strength(self, strength):
         self._strength = strength
@@ -370,14 +378,221 @@ class Solver(object):
     variables.
     """
 
+    # Constraint marked more times during one solve raises JuggleError
+    MAX_RESOLVE_COUNT = 100
+
     def __init__(self):
         # a dict of constraint -> name/variable mappings
         self._constraints = set()
-        self._marked_cons = []
         self._solving = False
 
+        # Constraints are split into connected components, constraints of
+        # different components do not share any variable. Components are
+        # kept in a union-find structure over constraints and variables
+        # (projections peeled). Removing a constraint does not split its
+        # component, components are rebuilt once enough constraints were
+        # removed, which also drops the removed constraints and unused
+        # variables.
+        # node -> parent node
+        self._parents = {}
+        # component root -> number of its constraints
+        self._sizes = {}
+        # constraints removed since the last rebuild
+        self._removed = 0
+
+        # Queues of marked constraints, one queue per component, so only
+        # components with dirty variables are solved. Every entry is a
+        # [constraint, sequence number] list, so it can be invalidated in
+        # constant time when the constraint is requeued or removed.
+        # Entries stay in the queues while solving, the count of entries
+        # of a constraint is used to detect juggling.
+        # component root -> list of entries
+        self._queues = {}
+        # constraint -> its valid queue entries, in queue order
+        self._queued = {}
+        # number of valid entries in the queues
+        self._queue_length = 0
+        # number of all entries in the queues
+        self._queue_size = 0
+        self._sequence = 0
+        # component root -> index of the first entry of its queue not solved
+        # yet, used while solving
+        self._cursors = {}
+
     constraints = property(lambda s: s._constraints)
 
+    _marked_cons = property(lambda s: [e[0] for e in sorted(
+                    (e for q in s._queues.itervalues() for e in q if e[0] is not None),
+                    key=lambda e: e[1])],
+                doc="Marked constraints in the order they were marked")
+
+
+    def _find(self, node):
+        """
+        Return root of the component of the node (constraint or variable).
+        """
+        parents = self._parents
+        parent = parents.setdefault(node, node)
+        while parent is not node:
+            # path halving
+            grandparent = parents[parent]
+            parents[node] = grandparent
+            node, parent = grandparent, parents[grandparent]
+        return node
+
+
+    def _union(self, a, b):
+        """
+        Merge components of the roots `a` and `b`, return the new root.
+        Queues of the components are merged too.
+        """
+        if a is b:
+            return a
+        sizes = self._sizes
+        if sizes.get(a, 0) < sizes.get(b, 0):
+            a, b = b, a
+        self._parents[b] = a
+        sizes[a] = sizes.get(a, 0) + sizes.pop(b, 0)
+        if b in self._queues:
+            # entries solved already are not merged, the rest is merged in
+            # the order of the sequence numbers; both parts are sorted, so
+            # the sort just merges two runs
+            tail = self._queues.pop(b)[self._cursors.pop(b, 0):]
+            queue = self._queues.setdefault(a, [])
+            cursor = self._cursors.get(a, 0)
+            if tail and queue[cursor:] and queue[-1][1] > tail[0][1]:
+                tail.extend(queue[cursor:])
+                tail.sort(key=itemgetter(1))
+                del queue[cursor:]
+            queue.extend(tail)
+        return a
+
+
+    def _connect(self, constraint):
+        """
+        Add the constraint to the component of its variables.
+        """
+        root = self._find(constraint)
+        self._sizes[root] = self._sizes.get(root, 0) + 1
+        for v in constraint.variables():
+            while isinstance(v, Projection):
+                v = v.variable()
+            root = self._union(root, self._find(v))
+
+
+    def rebuild_components(self):
+        """
+        Split the components, which fell apart after constraints removal.
+        Removed constraints and variables not used by any constraint are
+        dropped.
+        """
+        entries = sorted((e for q in self._queues.itervalues() for e in q
+                          if e[0] is not None), key=lambda e: e[1])
+        self._parents = {}
+        self._sizes = {}
+        self._removed = 0
+        for c in self._constraints:
+            self._connect(c)
+        self._queues = {}
+        self._cursors = {}
+        for entry in entries:
+            self._queues.setdefault(self._find(entry[0]), []).append(entry)
+        self._queue_size = len(entries)
+
+
+    def component_sizes(self, dirty_only=False):
+        """
+        Return sizes (numbers of constraints) of the constraint graph
+        components, the biggest first. Only components with marked
+        constraints are counted if `dirty_only` is set.
+
+        >>> from constraint import EqualsConstraint
+        >>> a, b, c, d = Variable(1.0), Variable(2.0), Variable(3.0), Variable(4.0)
+        >>> s = Solver()
+        >>> c_ab = s.add_constraint(EqualsConstraint(a, b))
+        >>> c_bc = s.add_constraint(EqualsConstraint(b, c))
+        >>> c_d = s.add_constraint(EqualsConstraint(d, d))
+        >>> s.component_sizes()
+        [2, 1]
+        >>> s.solve()
+        >>> d.value = 5
+        >>> s.component_sizes(dirty_only=True)
+        [1]
+        >>> s.remove_constraint(c_bc)
+        >>> s.component_sizes()
+        [1, 1]
+        """
+        if self._removed:
+            self.rebuild_components()
+        if dirty_only:
+            sizes = [self._sizes[root] for root, queue in self._queues.iteritems()
+                     if any(e[0] is not None for e in queue)]
+        else:
+            sizes = [size for size in self._sizes.itervalues() if size]
+        return sorted(sizes, reverse=True)
+
+
+    def _enqueue(self, c):
+        """
+        Append the constraint to the queue of its component, return number
+        of its entries.
+        """
+        self._sequence += 1
+        entry = [c, self._sequence]
+        self._queues.setdefault(self._find(c), []).append(entry)
+        entries = self._queued.setdefault(c, [])
+        entries.append(entry)
+        self._queue_length += 1
+        self._queue_size += 1
+        return len(entries)
+
+
+    def _dequeue(self, c, all=False):
+        """
+        Invalidate the first queue entry of the constraint, or all of its
+        entries if `all` is set.
+        """
+        entries = self._queued.get(c)
+        if not entries:
+            return
+        if all:
+            removed = self._queued.pop(c)
+        else:
+            removed = [entries.pop(0)]
+            if not entries:
+                del self._queued[c]
+        for entry in removed:
+            entry[0] = None
+        self._queue_length -= len(removed)
+
+        # drop invalid entries when they take most of the queues
+        if not self._solving and self._queue_size > 2 * self._queue_length + 64:
+            queues = {}
+            for root, queue in self._queues.iteritems():
+                queue = [e for e in queue if e[0] is not None]
+                if queue:
+                    queues[root] = queue
+            self._queues = queues
+            self._queue_size = self._queue_length
+
+
+    def _clear_queue(self):
+        self._queues = {}
+        self._cursors = {}
+        self._queued = {}
+        self._queue_length = 0
+        self._queue_size = 0
+        self._prune_components()
+
+
+    def _prune_components(self):
+        """
+        Rebuild components when removed constraints may have split them,
+        it's done rarely enough to keep the cost amortized.
+        """
+        if self._removed > len(self._constraints) // 2 + 64:
+            self.rebuild_components()
+
 
     def request_resolve(self, variable, projections_only=False):
         """
@@ -416,15 +631,15 @@ class Solver(object):
         for c in variable._constraints:
             if not projections_only or c._solver_has_projections:
                 if not self._solving:
-                    if c in self._marked_cons:
-                        self._marked_cons.remove(c)
+                    # move the constraint to the end of the queue
+                    self._dequeue(c)
                     c.mark_dirty(variable)
-                    self._marked_cons.append(c)
+                    self._enqueue(c)
                 else:
                     c.mark_dirty(variable)
-                    self._marked_cons.append(c)
-                    if self._marked_cons.count(c) > 100:
-                        raise JuggleError, 'Variable juggling detected, constraint %s resolved %d times out of %d' % (c, self._marked_cons.count(c), len(self._marked_cons))
+                    count = self._enqueue(c)
+                    if count > self.MAX_RESOLVE_COUNT:
+                        raise JuggleError, 'Variable juggling detected, constraint %s resolved %d times out of %d' % (c, count, self._queue_length)
 
 
     @observed
@@ -452,7 +667,8 @@ class Solver(object):
         """
         assert constraint, 'No constraint (%s)' % (constraint,)
         self._constraints.add(constraint)
-        self._marked_cons.append(constraint)
+        self._connect(constraint)
+        self._enqueue(constraint)
         constraint._solver_has_projections = False
         for v in constraint.variables():
             while isinstance(v, Projection):
@@ -489,9 +705,13 @@ class Solver(object):
             while isinstance(v, Projection):
                 v = v.variable()
             v._constraints.discard(constraint)
-        self._constraints.discard(constraint)
-        while constraint in self._marked_cons:
-            self._marked_cons.remove(constraint)
+        if constraint in self._constraints:
+            self._constraints.discard(constraint)
+            self._sizes[self._find(constraint)] -= 1
+            self._removed += 1
+        self._dequeue(constraint, all=True)
+        if not self._solving:
+            self._prune_components()
 
     reversible_pair(add_constraint, remove_constraint)
 
@@ -500,7 +720,7 @@ class Solver(object):
         """
         Request resolving a constraint.
         """
-        self._marked_cons.append(c)
+        self._enqueue(c)
 
 
     def constraints_with_variable(self, *variables):
@@ -549,10 +769,28 @@ class Solver(object):
         >>> eq_pr_a_b in s.constraints_with_variable(a, d)
         False
         """
-        # Use a copy of the original set, so constraints may be
+        # Candidates are looked up in the reverse index of variables
+        # (Variable._constraints). A constraint matches when it has all the
+        # variables, the smallest index set is intersected with the others.
+        # Constraints with projections match also when all their variables
+        # project the given ones. A new set is built, so constraints may be
         # deleted in the meantime.
         variables = set(variables)
-        for c in set(self._constraints):
+        if not variables:
+            candidates = set(self._constraints)
+        else:
+            indexes = []
+            for v in variables:
+                while isinstance(v, Projection):
+                    v = v.variable()
+                indexes.append(v._constraints)
+            indexes.sort(key=len)
+            candidates = indexes[0].intersection(*indexes[1:])
+            candidates.update(c for index in indexes for c in index
+                              if c._solver_has_projections)
+            candidates.intersection_update(self._constraints)
+
+        for c in candidates:
             if variables.issubset(set(c.variables())):
                 yield c
             elif c._solver_has_projections:
@@ -572,7 +810,7 @@ class Solver(object):
                     # All iteration have completed succesfully,
                     # so all variables are in the constraint
                     yield c
-                    
+
 
     def solve(self):
         """
@@ -605,22 +843,44 @@ class Solver(object):
         >>> c._value
         10.0
         """
-        marked_cons = self._marked_cons
         try:
             self._solving = True
 
-            # Solve each constraint. Using a counter makes it
-            # possible to also solve constraints that are marked as
-            # a result of other variabled being solved.
-            n = 0
-            while n < len(marked_cons):
-                c = marked_cons[n]
-                if not c.disabled:
-                    wvar = c.weakest()
-                    c.solve_for(wvar)
-                n += 1
-
-            self._marked_cons = []
+            # Solve components with marked constraints one by one.
+            # Solving a constraint may mark constraints of other
+            # components (e.g. canvas projections write both coordinates),
+            # even of the components solved already. So every queue has
+            # its cursor and components are solved until all cursors are
+            # at the end of their queues.
+            cursors = self._cursors
+            while True:
+                roots = [root for root, queue in self._queues.iteritems()
+                         if cursors.get(root, 0) < len(queue)]
+                if not roots:
+                    break
+                for root in roots:
+                    queue = self._queues.get(root)
+                    if queue is None:
+                        # merged with another component in the meantime
+                        continue
+                    # Solve each constraint. Using a counter makes it
+                    # possible to also solve constraints that are marked as
+                    # a result of other variabled being solved.
+                    # The cursor is kept up to date, so entries merged
+                    # into the queue are placed after the solved ones.
+                    n = cursors.get(root, 0)
+                    while n < len(queue):
+                        c = queue[n][0]
+                        n += 1
+                        cursors[root] = n
+                        if c is not None and not c.disabled:
+                            wvar = c.weakest()
+                            c.solve_for(wvar)
+                        if self._queues.get(root) is not queue:
+                            # merged with another component
+                            break
+
+            self._clear_queue()
         finally:
             self._solving = False
 
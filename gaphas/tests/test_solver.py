@@ -2,12 +2,15 @@
 Unit tests for Gaphas' solver.
 """
 
+import pickle
+import time
 import unittest
 from timeit import Timer
 
-from gaphas.solver import Solver, Variable
-from gaphas.constraint import EquationConstraint, EqualsConstraint, \
-    LessThanConstraint
+from gaphas.solver import Solver, Variable, Projection, \
+    JuggleError, WEAK, STRONG
+from gaphas.constraint import Constraint, EquationConstraint, \
+    EqualsConstraint, LessThanConstraint
 
 
 SETUP = """
@@ -137,10 +140,259 @@ class SizeTestCase(unittest.TestCase):
 
 
 
+class JugglingConstraint(Constraint):
+    """
+    Constraint changing its variable every time it is solved.
+    """
+    def solve_for(self, var):
+        var.value = var.value + 1
+
+
+
+class SolverQueueTestCase(unittest.TestCase):
+    """
+    Test queue of marked constraints.
+    """
+    def test_requeue_order(self):
+        """Test marked constraint is moved to the end of the queue"""
+        solver = Solver()
+        a, b, c = Variable(1.0), Variable(2.0), Variable(3.0)
+        c_ab = solver.add_constraint(EqualsConstraint(a, b))
+        c_bc = solver.add_constraint(EqualsConstraint(b, c))
+        self.assertEquals([c_ab, c_bc], solver._marked_cons)
+
+        a.value = 4
+        self.assertEquals([c_bc, c_ab], solver._marked_cons)
+
+        solver.remove_constraint(c_ab)
+        self.assertEquals([c_bc], solver._marked_cons)
+
+        solver.solve()
+        self.assertEquals([], solver._marked_cons)
+
+
+    def test_juggling(self):
+        """Test juggling detection"""
+        solver = Solver()
+        a = Variable(1.0)
+        solver.add_constraint(JugglingConstraint(a))
+        self.assertRaises(JuggleError, solver.solve)
+
+
+
+class RecordingConstraint(EqualsConstraint):
+    """
+    Equals constraint recording every solve.
+    """
+    solved = []
+
+    def solve_for(self, var):
+        self.solved.append(self)
+        super(RecordingConstraint, self).solve_for(var)
+
+
+
+class CrossingConstraint(EqualsConstraint):
+    """
+    Equals constraint writing a variable of another component once.
+    """
+    def __init__(self, a, b, other, value):
+        super(CrossingConstraint, self).__init__(a, b)
+        self.other = other
+        self.other_value = value
+
+    def solve_for(self, var):
+        super(CrossingConstraint, self).solve_for(var)
+        if self.other.value != self.other_value:
+            self.other.value = self.other_value
+
+
+
+class SolverComponentsTestCase(unittest.TestCase):
+    """
+    Test connected components of the constraint graph.
+    """
+    def test_dirty_component_only(self):
+        """Test only components with marked constraints are solved"""
+        solver = Solver()
+        a, b, c, d = [Variable(float(i)) for i in range(4)]
+        c_ab = solver.add_constraint(RecordingConstraint(a, b))
+        c_cd = solver.add_constraint(RecordingConstraint(c, d))
+        solver.solve()
+        self.assertEquals([1, 1], solver.component_sizes())
+
+        del RecordingConstraint.solved[:]
+        c.value = 5
+        self.assertEquals([1], solver.component_sizes(dirty_only=True))
+        solver.solve()
+        self.assertEquals(set([c_cd]), set(RecordingConstraint.solved))
+        self.assertEquals(5, d.value)
+        self.assertNotEquals(a.value, c.value)
+
+
+    def test_mark_solved_component(self):
+        """Test constraints marked in a solved component are solved"""
+        solver = Solver()
+        a1, b1 = Variable(1.0, STRONG), Variable(2.0, STRONG)
+        a2, b2 = Variable(3.0, WEAK), Variable(4.0, WEAK)
+        # whichever component is solved first, it's marked again by
+        # solving the other one
+        solver.add_constraint(CrossingConstraint(a1, a2, b1, 7.0))
+        solver.add_constraint(CrossingConstraint(b1, b2, a1, 9.0))
+        self.assertEquals([1, 1], solver.component_sizes())
+
+        solver.solve()
+        self.assertEquals((9.0, 9.0), (a1.value, a2.value))
+        self.assertEquals((7.0, 7.0), (b1.value, b2.value))
+        self.assertEquals([], solver._marked_cons)
+
+
+    def test_projection_connects_components(self):
+        """Test constraints sharing a projected variable are in one component"""
+        solver = Solver()
+        a, b, c = Variable(1.0), Variable(2.0), Variable(3.0)
+        solver.add_constraint(EqualsConstraint(a, b))
+        solver.add_constraint(EqualsConstraint(Projection(b), c))
+        self.assertEquals([2], solver.component_sizes())
+
+
+    def test_split_after_removal(self):
+        """Test components are split when a connecting constraint is removed"""
+        solver = Solver()
+        a, b, c = Variable(1.0), Variable(2.0), Variable(3.0)
+        solver.add_constraint(EqualsConstraint(a, b))
+        c_bc = solver.add_constraint(EqualsConstraint(b, c))
+        solver.add_constraint(EqualsConstraint(c, c))
+        self.assertEquals([3], solver.component_sizes())
+
+        solver.remove_constraint(c_bc)
+        self.assertEquals([1, 1], solver.component_sizes())
+
+
+    def test_merge_queues(self):
+        """Test queues of merged components keep the marking order"""
+        solver = Solver()
+        a, b, c, d = [Variable(float(i)) for i in range(4)]
+        c_ab = solver.add_constraint(RecordingConstraint(a, b))
+        c_cd = solver.add_constraint(RecordingConstraint(c, d))
+        solver.solve()
+
+        a.value = 5
+        c.value = 6
+        b.value = 7
+        c_bc = solver.add_constraint(RecordingConstraint(b, c))
+        self.assertEquals([3], solver.component_sizes())
+        queue, = solver._queues.values()
+        self.assertEquals([c_cd, c_ab, c_bc],
+                          [e[0] for e in queue if e[0] is not None])
+        self.assertEquals(sorted(e[1] for e in queue), [e[1] for e in queue])
+
+        del RecordingConstraint.solved[:]
+        solver.solve()
+        self.assertEquals([c_cd, c_ab, c_bc], RecordingConstraint.solved[:3])
+
+
+    def test_drop_removed(self):
+        """Test removed constraints and their variables are dropped"""
+        solver = Solver()
+        constraints = [solver.add_constraint(EqualsConstraint(Variable(),
+                                                              Variable()))
+                       for i in range(1000)]
+        solver.solve()
+        for c in constraints:
+            solver.remove_constraint(c)
+        # at most 64 constraints with 2 variables wait for the rebuild
+        self.assertTrue(len(solver._parents) <= 3 * 65)
+        self.assertTrue(len(solver._sizes) <= 65)
+        self.assertEquals([], solver.component_sizes())
+        self.assertEquals({}, solver._parents)
+
+
+
+class ConstraintsWithVariableTestCase(unittest.TestCase):
+    """
+    Test lookup of constraints by variables.
+    """
+    def test_other_solver(self):
+        """Test constraints of other solvers are not found"""
+        s1, s2 = Solver(), Solver()
+        a, b = Variable(1.0), Variable(2.0)
+        c1 = s1.add_constraint(EqualsConstraint(a, b))
+        c2 = s2.add_constraint(EqualsConstraint(a, b))
+        self.assertEquals([c1], list(s1.constraints_with_variable(a, b)))
+        self.assertEquals([c2], list(s2.constraints_with_variable(a)))
+
+        s1.remove_constraint(c1)
+        self.assertEquals([], list(s1.constraints_with_variable(a)))
+
+
+    def test_remove_while_iterating(self):
+        """Test constraints can be removed while iterating"""
+        solver = Solver()
+        a = Variable(1.0)
+        for i in range(3):
+            solver.add_constraint(EqualsConstraint(a, Variable(2.0)))
+        for c in solver.constraints_with_variable(a):
+            solver.remove_constraint(c)
+        self.assertEquals(set(), solver.constraints)
+
+
+
+class VariableStateTestCase(unittest.TestCase):
+    """
+    Test state of slotted variables.
+    """
+    def test_pickle(self):
+        """Test variables keep their solver after unpickling"""
+        solver = Solver()
+        a, b = Variable(1.0, WEAK), Variable(2.0, STRONG)
+        solver.add_constraint(EqualsConstraint(a, b))
+        solver.solve()
+        solver2, a2, b2 = pickle.loads(pickle.dumps((solver, a, b)))
+        self.assertEquals(2.0, a2.value)
+        self.assertEquals(STRONG, b2.strength)
+        self.assertTrue(a2._solver is solver2)
+
+        b2.value = 4
+        solver2.solve()
+        self.assertEquals(4.0, a2.value)
+        self.assertEquals(2.0, a.value)
+
+
+    def test_slots(self):
+        """Test variables don't have instance dictionary"""
+        self.assertFalse(hasattr(Variable(), '__dict__'))
+
+
+
 class SolverSpeedTestCase(unittest.TestCase):
     """
     Solver speed tests.
     """
+    def test_speed_mark_shared_variable(self):
+        """
+        Speed test for marking variable shared by 10000 constraints.
+        """
+        solver = Solver()
+        hub = Variable(0.0, STRONG)
+        leaves = [Variable(0.0) for i in xrange(10000)]
+        for leaf in leaves:
+            solver.add_constraint(EqualsConstraint(hub, leaf))
+        solver.solve()
+
+        start = time.time()
+        for i in xrange(10):
+            hub.value = i
+        solver.solve()
+        elapsed = time.time() - start
+
+        self.assertEquals([], solver._marked_cons)
+        self.assertEquals([9.0] * 10000, [leaf.value for leaf in leaves])
+        # marking is linear in the number of constraints, list based
+        # queue took minutes here
+        self.assertTrue(elapsed < 5, elapsed)
+
+
     def _test_speed_run_weakest(self):
         """
         Speed test for weakest variable.
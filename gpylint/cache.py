@@ -0,0 +1,269 @@
+'''
+Caches used by the linters
+Messages of every checked module are stored under the hash of the module
+source, pylintrc and enabled checkers, so unchanged modules don't need to
+be checked again. Parsed modules are kept in the ASTNG cache until their
+files change on disk.
+'''
+
+import os
+import hashlib
+import cPickle as pickle
+from collections import OrderedDict
+
+CACHE_FILE = '.lint_cache'
+
+class LintCache(object):
+
+    '''
+    Content addressed cache of pylint messages with LRU eviction
+    '''
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(LintCache, cls).__new__(\
+                    cls, *args, **kwargs)
+
+        return cls._instance
+
+    # key => list of (msg_id, location, msg) tuples
+    entries = OrderedDict()
+    max_entries = 5000
+    hits = 0
+    misses = 0
+
+    def get_key(self, filepath, modname, salt):
+        '''
+        Return the cache key of the module or None if the source
+        can't be read
+        @param filepath - path of the module
+        @param modname - name of the module
+        @param salt - hash of the linter configuration, see get_salt
+        '''
+        try:
+            with open(filepath) as f:
+                source = f.read()
+        except IOError:
+            return None
+        return hashlib.sha1('\0'.join(\
+                [filepath, modname, salt, source])).hexdigest()
+
+    def get_salt(self, pylintrc, checkers):
+        '''
+        Return hash of the configuration the messages depend on
+        @param pylintrc - path of the pylintrc file or None
+        @param checkers - names of the enabled checkers
+        '''
+        content = ''
+        if pylintrc:
+            try:
+                with open(pylintrc) as f:
+                    content = f.read()
+            except IOError:
+                pass
+        return hashlib.sha1('\0'.join(\
+                [content] + sorted(set(checkers)))).hexdigest()
+
+    def get(self, key):
+        '''
+        Return cached messages or None if the key is not cached
+        '''
+        if key is None or key not in self.entries:
+            self.misses += 1
+            return None
+        self.hits += 1
+        # move the entry to the end, so it's evicted last
+        messages = self.entries.pop(key)
+        self.entries[key] = messages
+        return messages
+
+    def set(self, key, messages):
+        if key is None:
+            return
+        self.entries.pop(key, None)
+        self.entries[key] = messages
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def set_max_entries(self, max_entries):
+        self.max_entries = max(0, max_entries)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = self.misses = 0
+
+    def get_stats(self):
+        '''
+        Return dictionary with statistics of the cache
+        '''
+        return {
+                'entries': len(self.entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+               }
+
+    def load(self, filename=CACHE_FILE):
+        try:
+            with open(filename, 'rb') as f:
+                entries = pickle.load(f)
+        except (IOError, EOFError, pickle.UnpicklingError):
+            return
+        for key, messages in entries.iteritems():
+            self.set(key, messages)
+
+    def save(self, filename=CACHE_FILE):
+        with open(filename, 'wb') as f:
+            pickle.dump(self.entries, f, pickle.HIGHEST_PROTOCOL)
+
+lint_cache = LintCache()
+
+class RecordingReporter(object):
+
+    '''
+    Reporter proxy, passes everything to the wrapped reporter and records
+    messages while recording is turned on
+    '''
+
+    def __init__(self, reporter):
+        self.__dict__['_reporter'] = reporter
+        self.__dict__['recorded'] = None
+
+    def add_message(self, msg_id, location, msg):
+        if self.recorded is not None:
+            self.recorded.append((msg_id, location, msg))
+        self._reporter.add_message(msg_id, location, msg)
+
+    def __getattr__(self, name):
+        return getattr(self._reporter, name)
+
+    def __setattr__(self, name, value):
+        if name in self.__dict__:
+            self.__dict__[name] = value
+        else:
+            setattr(self._reporter, name, value)
+
+class ASTNGCache(dict):
+
+    '''
+    Replacement of the ASTNGManager's module cache
+    Parsed modules are kept between checks, modules are evicted when their
+    files change on disk or when the cache is full (least recently used
+    modules first)
+    '''
+
+    def __init__(self, entries=(), max_entries=2000):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        # module name => (absolute file path, mtime)
+        self._files = {}
+        # module name => tick of the last access
+        self._used = {}
+        self._tick = 0
+        dict.__init__(self)
+        self.update(entries)
+
+    def __contains__(self, modname):
+        if dict.__contains__(self, modname):
+            self.hits += 1
+            self._tick += 1
+            self._used[modname] = self._tick
+            return True
+        self.misses += 1
+        return False
+
+    def __setitem__(self, modname, module):
+        dict.__setitem__(self, modname, module)
+        filepath = getattr(module, 'file', None)
+        if filepath and os.path.exists(filepath):
+            filepath = os.path.abspath(filepath)
+            self._files[modname] = filepath, os.path.getmtime(filepath)
+        else:
+            self._files.pop(modname, None)
+        self._tick += 1
+        self._used[modname] = self._tick
+        if len(self) > self.max_entries:
+            self._evict_unused()
+
+    def __delitem__(self, modname):
+        dict.__delitem__(self, modname)
+        self._files.pop(modname, None)
+        self._used.pop(modname, None)
+
+    def update(self, entries=(), **kwargs):
+        for modname, module in dict(entries, **kwargs).iteritems():
+            self[modname] = module
+
+    def pop(self, modname, *default):
+        if dict.__contains__(self, modname):
+            module = dict.__getitem__(self, modname)
+            del self[modname]
+            return module
+        if default:
+            return default[0]
+        raise KeyError(modname)
+
+    def clear(self):
+        dict.clear(self)
+        self._files.clear()
+        self._used.clear()
+
+    def _evict_unused(self):
+        '''
+        Evict the least recently used tenth of the modules
+        '''
+        count = len(self) - self.max_entries + self.max_entries // 10
+        for modname in sorted(self.keys(), key=self._used.get)[:count]:
+            del self[modname]
+
+    def set_max_entries(self, max_entries):
+        self.max_entries = max(1, max_entries)
+        if len(self) > self.max_entries:
+            self._evict_unused()
+
+    def invalidate(self, filepaths=()):
+        '''
+        Evict modules of the given files and modules whose files changed
+        on disk since they were parsed
+        @param filepaths - paths of the files to be evicted in any case
+        '''
+        filepaths = set(os.path.abspath(filepath) for filepath in filepaths)
+        for modname, (filepath, mtime) in self._files.items():
+            if filepath in filepaths:
+                del self[modname]
+                continue
+            try:
+                changed = os.path.getmtime(filepath) != mtime
+            except OSError:
+                changed = True
+            if changed:
+                del self[modname]
+
+    def get_stats(self):
+        '''
+        Return dictionary with statistics of the cache
+        '''
+        return {
+                'entries': len(self),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+               }
+
+def install_astng_cache(manager, max_entries):
+    '''
+    Replace module cache of the ASTNGManager with ASTNGCache
+    The manager shares its state between all instances, so the cache is
+    used by both the linters and the scanner
+    @param manager - ASTNGManager instance
+    @param max_entries - maximal number of cached modules
+    '''
+    if not isinstance(manager.astng_cache, ASTNGCache):
+        manager.astng_cache = ASTNGCache(manager.astng_cache)
+    manager.astng_cache.set_max_entries(max_entries)
+    return manager.astng_cache
@@ -3,7 +3,7 @@ This modules is responsible for drawing classes and modules on canvas
 Author: Jan Vorcak <vorcak@mail.muni.cz>
 '''
 
-from gpylint.canvas.items import AssociationLine
+from gpylint.canvas.items import AssociationLine, ClassBox
 from gaphas.aspect import Connector, ConnectionSink
 
 class CanvasContext(object):
@@ -22,7 +22,14 @@ class CanvasContext(object):
 
         return cls._instance
 
+    # (filepath, name, index) => ClassBox, see diagrams.get_node_key
     dictionary = {}
+    # (filepath, name) => ClassBox, used to find boxes of the messages
+    names = {}
+    # (head key, tail key, arrowhead, arrowtail, label) => AssociationLine
+    associations = {}
+    # message category => boxes with messages of the category
+    severities = ClassBox.severities
 
 
 def set_association(canvas, o1, o2, props):
@@ -41,7 +48,8 @@ def set_association(canvas, o1, o2, props):
 
     canvas.add(line)
 
-    ports = o1.add_moveable_handle(canvas, o2)
+    handles, ports, constraint = o1.add_moveable_handle(canvas, o2)
+    line.association = o1, o2, handles, ports, constraint
 
     connector = Connector(line, line.handles()[0])
     connector.connect(ConnectionSink(o1, ports[0]))
@@ -49,3 +57,20 @@ def set_association(canvas, o1, o2, props):
     connector = Connector(line, line.handles()[1])
     connector.connect(ConnectionSink(o2, ports[1]))
 
+    return line
+
+def remove_association(canvas, line):
+    '''
+    Remove association created by set_association together with the
+    handles, ports and constraint it added to the associated objects
+    @param canvas - canvas the association is drawn on
+    @param line - AssociationLine returned by set_association
+    '''
+    o1, o2, handles, ports, constraint = line.association
+    canvas.remove(line)
+    canvas.solver.remove_constraint(constraint)
+    for obj, handle, port in zip((o1, o2), handles, ports):
+        obj._handles.remove(handle)
+        obj._ports.remove(port)
+        obj.request_update()
+
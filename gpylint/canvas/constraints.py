@@ -1,4 +1,5 @@
 from gaphas.constraint import Constraint, _update
+from gaphas.item import NW, NE, SE, SW
 
 class HandlesConstraint(Constraint):
 
@@ -20,26 +21,75 @@ class HandlesConstraint(Constraint):
         self.hp = hp
 
     def solve_for(self, var):
-        self._solve_for(self.o1, self.hp[0])
-        self._solve_for(self.o2, self.hp[1])
-
-    def _solve_for(self, obj, updated_pos):
-        two_boxes_line = (self.o1.get_canvas_handle().pos, \
-                self.o2.get_canvas_handle().pos)
-
-        NW = obj.get_canvas_handle('NW')
-        NE = obj.get_canvas_handle('NE')
-        SW = obj.get_canvas_handle('SW')
-        SE = obj.get_canvas_handle('SE')
-
-        point = get_cross_point(two_boxes_line, (NE, NW)) or \
-                get_cross_point(two_boxes_line, (SE, SW)) or \
-                get_cross_point(two_boxes_line, (SW, NW)) or \
-                get_cross_point(two_boxes_line, (NE, SE))
-
-        if point:
-            _update(updated_pos[0], point[0])
-            _update(updated_pos[1], point[1])
+        '''
+        Move handles to the borders of the boxes, cross points of both
+        line segments are computed by one call of get_cross_points
+        '''
+        lines = []
+        edges = []
+        for line, box_edges in self.get_segments():
+            lines.append(line)
+            edges.append(box_edges)
+
+        points = get_cross_points(lines, edges)
+        for updated_pos, point in zip(self.hp, points):
+            if point:
+                _update(updated_pos[0], point[0])
+                _update(updated_pos[1], point[1])
+
+    def get_segments(self):
+        '''
+        Return the line between centers of the boxes together with edges
+        of the first and of the second box, see get_cross_points
+        '''
+        center1, edges1 = get_box_geometry(self.o1)
+        center2, edges2 = get_box_geometry(self.o2)
+        line = center1 + center2
+        return [(line, edges1), (line, edges2)]
+
+def get_box_geometry(obj):
+    '''
+    Return center and edges of the box in canvas coordinates
+    @return tuple (center, edges)
+            center - tuple (x, y)
+            edges - list of (x1, y1, x2, y2) tuples, top, bottom, left and
+                    right edge
+    '''
+    transform = obj.canvas.get_matrix_i2c(obj).transform_point
+    handles = obj.handles()
+    nw, ne, se, sw = [transform(float(handles[i].pos.x), \
+            float(handles[i].pos.y)) for i in (NW, NE, SE, SW)]
+    center = (nw[0] + se[0]) / 2., (nw[1] + se[1]) / 2.
+    return center, [ne + nw, se + sw, sw + nw, ne + se]
+
+def get_cross_points(lines, edges):
+    '''
+    Return cross points of the line segments with the edges, the first
+    crossed edge is taken for every line segment
+    @param lines - list of (x1, y1, x2, y2) tuples
+    @param edges - list of lists of (x1, y1, x2, y2) tuples, edges tested
+                   against the line segment of the same index
+    @return list of (x, y) tuples, None for the line segments which don't
+            cross any edge
+    '''
+    points = []
+    for (a, b, c, d), line_edges in zip(lines, edges):
+        dx, dy = c - a, d - b
+        point = None
+        for e, f, g, h in line_edges:
+            ex, ey = g - e, h - f
+            denom = float(dx * ey - dy * ex)
+            # parallel lines
+            if denom == 0:
+                continue
+            # parameters of the cross point on the line and on the edge
+            t = ((e - a) * ey - (f - b) * ex) / denom
+            u = ((e - a) * dy - (f - b) * dx) / denom
+            if 0 <= t <= 1 and 0 <= u <= 1:
+                point = a + t * dx, b + t * dy
+                break
+        points.append(point)
+    return points
 
 def get_cross_point(line1, line2):
     '''
@@ -50,40 +100,7 @@ def get_cross_point(line1, line2):
     @return Tuple of floats - cross point of two line segments
             None - if lines are parallel or not crossed in selected intervals
     '''
-
-    # init variables
-    p1, p2 = line1
-    p3, p4 = line2
-
-    a,b,c,d,e,f,g,h = p1[0].value, p1[1].value, p2[0].value, p2[1].value, \
-            p3[0].value, p3[1].value, p4[0].value, p4[1].value
-
-    # check if lines are parallel
-    if (a-c)*(f-h) - (b-d)*(e-g) == 0:
-        return None
-
-    # get y from parametric equations
-    y = (b*(c-a)*(h-f) - a*(d-b)*(h-f) - f*(g-e)*(d-b) + e*(d-b)*(h-f))/\
-            ((c-a)*(h-f)-(g-e)*(d-b))
-    if h-f != 0:
-        x = e+(g-e)*(y-f)/(h-f)
-        ty = (y-f)/(h-f)
-    if d-b != 0:
-        x = a+(c-a)*(y-b)/(d-b)
-        ty = (y-b)/(d-b)
-
-    if c-a != 0:
-        tx = (x-a)/(c-a)
-
-    if g-e != 0:
-        tx = (x-e)/(g-e)
-
-    # check if tx and ty belongs to <0,1>, since we check cross point of
-    # line segments
-    if not (0 <= tx <= 1):
-        return None
-
-    if not (0 <= ty <= 1):
-        return None
-
-    return x, y
+    (p1, p2), (p3, p4) = line1, line2
+    line = p1[0].value, p1[1].value, p2[0].value, p2[1].value
+    edge = p3[0].value, p3[1].value, p4[0].value, p4[1].value
+    return get_cross_points([line], [[edge]])[0]
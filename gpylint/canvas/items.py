@@ -8,6 +8,30 @@ from gaphas.util import text_align, text_extents
 
 from gpylint.canvas.constraints import HandlesConstraint
 
+# message categories ordered by severity, index of the category is its
+# slot in the error counters of ClassBox
+CATEGORIES = 'FEWRCI'
+CATEGORY_SLOTS = dict((category, i) for i, category in enumerate(CATEGORIES))
+
+# (text, font) => (width, height)
+_extents_cache = {}
+
+def get_text_extents(cr, text, font=None):
+    '''
+    Return size of the text, every text is measured just once
+    '''
+    key = text, font
+    if key not in _extents_cache:
+        _extents_cache[key] = text_extents(cr, text, font)
+    return _extents_cache[key]
+
+def get_box_size(cr, title, font=None):
+    '''
+    Return size of the ClassBox with the title, the box is as big as its
+    title plus margins
+    '''
+    width, height = get_text_extents(cr, str(title), font)
+    return width + 50, height + 50
 
 class Box(Element):
     """ A Box has 5 handles:
@@ -23,12 +47,33 @@ class Box(Element):
             handle.visible = False
             handle.moveable = False
 
-    def add_central_handle(self):
+        # central handle is created once and kept in the middle of the box
+        # by update_central_handle
         self._central_handle = Handle(strength=STRONG)
         self._central_handle.visible = False
-        self._central_handle.pos = self.width / 2.0, self.height / 2.0
+        self._central_handle.moveable = False
         self._ports.append(PointPort(self._central_handle.pos))
         self._handles.append(self._central_handle)
+        self.update_central_handle()
+
+    def update_central_handle(self):
+        '''
+        Move the central handle to the middle of the box, variables are
+        changed only if the box was resized, so the solver isn't triggered
+        otherwise
+        '''
+        nw = self._handles[NW].pos
+        pos = self._central_handle.pos
+        x = float(nw.x) + self.width / 2.0
+        y = float(nw.y) + self.height / 2.0
+        if float(pos.x) != x:
+            pos.x = x
+        if float(pos.y) != y:
+            pos.y = y
+
+    def pre_update(self, context):
+        super(Box, self).pre_update(context)
+        self.update_central_handle()
 
     def get_canvas_handle(self, handle_type='central'):
         '''
@@ -86,7 +131,9 @@ class AssociationLine(Line):
 
         {
             'diamond': self.draw_head_composite,
-            'empty': self.draw_head_navigable
+            'empty': self.draw_head_navigable,
+            'open': self.draw_head_navigable,
+            'none': self.draw_head_undefined
         }[self.props['arrowhead']](context)
 
     def draw_head_none(self, context):
@@ -221,55 +268,106 @@ class AssociationLine(Line):
         context.cairo.line_to(0, 0)
 
 
+class SeverityIndex(object):
+
+    '''
+    Boxes having at least one message of the category, indexed by the
+    message category
+    '''
+
+    def __init__(self):
+        self.boxes = dict((category, set()) for category in CATEGORIES)
+
+    def add(self, category, box):
+        self.boxes[category].add(box)
+
+    def discard(self, category, box):
+        self.boxes[category].discard(box)
+
+    def get_boxes(self, category=None):
+        '''
+        Return boxes with messages of the category, boxes with any message
+        when the category is None
+        '''
+        if category is not None:
+            return set(self.boxes[category])
+        return set().union(*self.boxes.values())
+
 class ClassBox(Box):
     '''
     This class represents class on the canvas
     '''
 
+    # font of the title, default font of the context is used when None
+    font = None
+
     def __init__(self, props, width=100, height=100):
         super(ClassBox, self).__init__(width, height)
         self.properties = props
+        # (title, font) the box was sized for
+        self._sized_for = None
+        # number of messages of every category, see CATEGORIES
+        self.error_counts = [0] * len(CATEGORIES)
+        self.error_count = 0
 
-    errors = {}
+    # boxes with messages of the canvas, shared by all boxes
+    severities = SeverityIndex()
 
-    is_error = property(lambda x: sum(x.errors.values())>0)
+    is_error = property(lambda x: x.error_count > 0)
     filepath = property(lambda x: x.properties['filepath'])
     title = property(lambda x: x.properties['title'])
     lineno = property(lambda x: x.properties['lineno'])
 
     def add_error(self, error):
-        etype = error[0]
-        if etype in self.errors:
-            self.errors[etype] += 1
-        else:
-            self.errors[etype] = 1
+        category = error[0]
+        slot = CATEGORY_SLOTS.get(category)
+        if slot is None:
+            return
+        self.error_counts[slot] += 1
+        self.error_count += 1
+        if self.error_counts[slot] == 1:
+            self.severities.add(category, self)
 
     def clear_errors(self):
-        self.errors = {}
-
-    def draw(self, context):
-        # count the size of the Box
-        self.width, self.height = text_extents(context.cairo, \
-                str(self.title))
+        for category, count in zip(CATEGORIES, self.error_counts):
+            if count:
+                self.severities.discard(category, self)
+        self.error_counts = [0] * len(CATEGORIES)
+        self.error_count = 0
 
-        self.width += 50
-        self.height += 50
+    def get_severity(self):
+        '''
+        Return the most severe category of the messages, None if the box
+        has no messages
+        '''
+        if not self.error_count:
+            return None
+        for category, count in zip(CATEGORIES, self.error_counts):
+            if count:
+                return category
 
-        # now we have position so we can add central handle and draw object
-        self.add_central_handle()
+    def pre_update(self, context):
+        '''
+        Size the box when its title changes, so draw doesn't need to
+        measure the text
+        '''
+        if self._sized_for != (self.title, self.font):
+            self.width, self.height = get_box_size(context.cairo, \
+                    self.title, self.font)
+            self._sized_for = self.title, self.font
+        super(ClassBox, self).pre_update(context)
 
+    def draw(self, context):
         super(ClassBox, self).draw(context)
         c = context.cairo
         x,y = self._central_handle.pos
         text_align(c, x, 10, str(self.title), 0, 0)
 
-        count = sum(self.errors.values())
-        if count > 0:
+        if self.error_count > 0:
             text_align(c, x, 30, str(self.get_error_string()), 0, 0)
 
     def get_error_string(self):
-        count = sum(self.errors.values())
-        return str(count) + ' errors'
+        return str(self.error_count) + ' errors'
 
     def _create_handle_and_port(self):
         handle = Handle(strength=VERY_STRONG)
@@ -279,7 +377,13 @@ class ClassBox(Box):
         return handle, port
 
     def add_moveable_handle(self, canvas, snd_obj):
+        '''
+        Add handle and port to both objects, these are kept on the border
+        of the objects by HandlesConstraint
+        @return tuple (handles, ports, constraint)
+        '''
         projections = []
+        handles = []
         ports = []
         for obj in [self, snd_obj]:
             handle, port = self._create_handle_and_port()
@@ -287,6 +391,7 @@ class ClassBox(Box):
             obj._handles.append(handle)
             hp = CanvasProjection(handle.pos, obj)
             projections.append(hp)
+            handles.append(handle)
             ports.append(port)
 
         # function is given a list of projections
@@ -294,4 +399,4 @@ class ClassBox(Box):
         c = HandlesConstraint(o1=self, o2=snd_obj, hp=projections)
         canvas.solver.add_constraint(c)
 
-        return ports
+        return handles, ports, c
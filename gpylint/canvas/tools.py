@@ -2,6 +2,7 @@ from gi.repository import Gtk
 
 from gaphas.tool import Tool
 from gpylint.windows import WindowManager
+from gpylint.scanner import TogglePackage
 
 wm = WindowManager()
 
@@ -12,7 +13,10 @@ class OpenEditorTool(Tool):
 
     def on_double_click(self, event):
         class_box = self.view.hovered_item
-        if not hasattr(class_box, 'filepath') or not getattr(class_box, 'filepath'):
+        package = getattr(class_box, 'properties', {}).get('package')
+        if package:
+            TogglePackage(self.view, package).start()
+        elif not hasattr(class_box, 'filepath') or not getattr(class_box, 'filepath'):
             # TODO add parent instead of None
             dialog = Gtk.MessageDialog(None, 0, Gtk.MessageType.INFO,
                     Gtk.ButtonsType.OK, 'Can\'t show source code')
@@ -0,0 +1,394 @@
+'''
+Class diagram of the project built from the cached scan results
+Classes and relationships of every module are extracted once and kept in
+the ScanCache, so refreshing the diagram only needs to parse and link
+modules which have changed since the last scan
+'''
+
+import os
+import hashlib
+import cPickle as pickle
+from threading import Lock
+
+from logilab import astng
+from pylint.pyreverse.utils import is_interface
+
+CACHE_FILE = '.scan_cache'
+# version of the cached entries, entries of other versions are not loaded
+CACHE_VERSION = 2
+
+class DiagramObject(object):
+
+    '''
+    Class placed in the diagram, it's identified by its file, name
+    qualified within the module and index of the definition (see
+    get_node_key), so nested classes of the same name don't clash
+    '''
+
+    def __init__(self, title, filepath, lineno, shape='class', name=None, \
+            index=0):
+        self.title = title
+        self.filepath = filepath
+        self.lineno = lineno
+        self.shape = shape
+        self.name = name or title
+        self.index = index
+
+    key = property(lambda x: (x.filepath, x.name, x.index))
+
+class Relationship(object):
+
+    '''
+    Relationship between two objects of the diagram
+    '''
+
+    def __init__(self, from_object, to_object, relationship_type, name=None):
+        self.from_object = from_object
+        self.to_object = to_object
+        self.type = relationship_type
+        self.name = name
+
+class ClassDiagram(object):
+
+    '''
+    Class diagram compatible with pyreverse's DiagramWriter
+    Objects are patched module by module, objects of the unchanged modules
+    are kept between scans
+    '''
+
+    TYPE = 'class'
+
+    def __init__(self, title='classes'):
+        self.title = title
+        # filepath => list of DiagramObject
+        self._module_objects = {}
+        # (filepath, name, index) => DiagramObject
+        self._objects = {}
+        self.relationships = []
+
+    objects = property(lambda x: x._objects.values())
+
+    def get_object(self, key):
+        return self._objects.get(key)
+
+    def remove_module(self, filepath):
+        for obj in self._module_objects.pop(filepath, ()):
+            self._objects.pop(obj.key, None)
+
+    def set_module(self, filepath, entry):
+        '''
+        Replace objects of the module with classes of the cache entry
+        '''
+        self.remove_module(filepath)
+        objects = []
+        for title, key, lineno, shape in entry.classes:
+            obj = DiagramObject(title, filepath, lineno, shape, key[1], \
+                    key[2])
+            self._objects[obj.key] = obj
+            objects.append(obj)
+        self._module_objects[filepath] = objects
+
+    def link(self, entries):
+        '''
+        Resolve relationships of the cache entries, relationships to classes
+        out of the diagram are skipped
+        '''
+        self.relationships = []
+        for entry in entries:
+            for from_key, to_key, relationship_type, name in \
+                    entry.relationships:
+                from_object = self._objects.get(from_key)
+                to_object = self._objects.get(to_key)
+                if from_object is not None and to_object is not None:
+                    self.relationships.append(Relationship(from_object, \
+                            to_object, relationship_type, name))
+
+    def get_relationships(self, role):
+        return [rel for rel in self.relationships if rel.type == role]
+
+class PackageDiagram(object):
+
+    '''
+    Class diagram partitioned by packages, every package is shown as one
+    node and classes are in the diagram just for the expanded packages.
+    Relationships of the classes in collapsed packages are redirected to
+    their package nodes.
+    '''
+
+    TYPE = 'class'
+
+    def __init__(self, title='packages'):
+        self.title = title
+        self.objects = []
+        self.relationships = []
+
+    def get_relationships(self, role):
+        return [rel for rel in self.relationships if rel.type == role]
+
+    def build(self, diagram, entries, expanded):
+        '''
+        @param diagram - ClassDiagram with classes of all modules
+        @param entries - ModuleEntry objects of the project
+        @param expanded - names of the expanded packages
+        '''
+        packages = {}
+        # module file => package name
+        file_packages = {}
+        # module name => package name
+        name_packages = {}
+        for entry in entries:
+            package = get_package_name(entry)
+            file_packages[entry.file] = package
+            name_packages[entry.name] = package
+            if package not in packages:
+                packages[package] = DiagramObject(package, '', '', 'package')
+
+        # class key => the class if its package is expanded, package node
+        # otherwise
+        visible = {}
+        self.objects = packages.values()
+        for obj in diagram.objects:
+            package = file_packages.get(obj.filepath)
+            if package is None:
+                continue
+            if package in expanded:
+                visible[obj.key] = obj
+                self.objects.append(obj)
+            else:
+                visible[obj.key] = packages[package]
+
+        relationships = {}
+        def add(from_object, to_object, relationship_type, name=None):
+            if from_object is to_object:
+                return
+            key = from_object.key, to_object.key, relationship_type
+            if key not in relationships:
+                relationships[key] = Relationship(from_object, to_object, \
+                        relationship_type, name)
+
+        for rel in diagram.relationships:
+            from_object = visible.get(rel.from_object.key)
+            to_object = visible.get(rel.to_object.key)
+            if from_object is None or to_object is None:
+                continue
+            if from_object.shape == 'package' or to_object.shape == 'package':
+                add(from_object, to_object, 'depends')
+            else:
+                add(from_object, to_object, rel.type, rel.name)
+
+        for entry in entries:
+            for name in entry.depends:
+                if name in name_packages:
+                    add(packages[file_packages[entry.file]], \
+                            packages[name_packages[name]], 'depends')
+
+        # classes of the expanded packages without base class in the diagram
+        # hang below their package node
+        with_base = set(from_key for from_key, to_key, relationship_type \
+                in relationships if relationship_type == 'specialization')
+        for obj in self.objects:
+            if obj.shape != 'package' and obj.key not in with_base:
+                add(obj, packages[file_packages[obj.filepath]], 'contains')
+
+        self.relationships = relationships.values()
+
+class ModuleEntry(object):
+
+    '''
+    Classes and relationships extracted from one module
+    '''
+
+    def __init__(self, name, filepath, mtime, digest):
+        self.name = name
+        self.file = filepath
+        self.mtime = mtime
+        self.digest = digest
+        # names of imported modules
+        self.depends = []
+        # list of (title, key, lineno, shape), see get_node_key
+        self.classes = []
+        # list of (from key, to key, type, name), see get_node_key
+        self.relationships = []
+
+def get_package_name(entry):
+    '''
+    Return name of the package the module belongs to, top level modules
+    are packages of their own
+    '''
+    if os.path.basename(entry.file).startswith('__init__.'):
+        return entry.name
+    return entry.name.rsplit('.', 1)[0]
+
+def get_digest(filepath):
+    with open(filepath, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+def get_node_key(node):
+    '''
+    Return (filepath, name, index) key of the class, the name is qualified
+    within the module, e.g. Outer.Inner, the index tells apart classes
+    defined by the same name in one scope (e.g. in both branches of if)
+    Line numbers are not used, so keys don't change when lines are added
+    above the class
+    '''
+    root = node.root()
+    name = node.qname()[len(root.name) + 1:]
+    definitions = [n for n in node.parent.scope().locals.get(node.name, ()) \
+            if isinstance(n, astng.Class)]
+    index = definitions.index(node) if node in definitions else 0
+    return root.file, name, index
+
+def extract_module(module, entry):
+    '''
+    Extract classes and relationships from the module tagged by Linker
+    the same way pyreverse's ClassDiagram does
+    @param module - astng module visited by Linker
+    @param entry - ModuleEntry to be filled
+    '''
+    entry.depends = list(getattr(module, 'depends', []))
+    for node in module.nodes_of_class(astng.Class):
+        key = get_node_key(node)
+        shape = is_interface(node) and 'interface' or 'class'
+        entry.classes.append((node.name, key, node.lineno, shape))
+
+        for par_node in node.ancestors(recurs=False):
+            entry.relationships.append((key, get_node_key(par_node), \
+                    'specialization', None))
+
+        for impl_node in getattr(node, 'implements', ()):
+            entry.relationships.append((key, get_node_key(impl_node), \
+                    'implements', None))
+
+        attrs_types = getattr(node, 'instance_attrs_type', {}).items() + \
+                getattr(node, 'locals_type', {}).items()
+        for name, values in attrs_types:
+            for value in values:
+                if value is astng.YES:
+                    continue
+                if isinstance(value, astng.Instance):
+                    value = value._proxied
+                if isinstance(value, astng.Class):
+                    entry.relationships.append((get_node_key(value), key, \
+                            'association', name))
+
+class ScanCache(object):
+
+    '''
+    Scan results of the project modules keyed by the module file, a module
+    is considered changed when its mtime and content hash differ from the
+    cached ones
+    '''
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ScanCache, cls).__new__(\
+                    cls, *args, **kwargs)
+
+        return cls._instance
+
+    # module file => ModuleEntry
+    entries = {}
+    diagram = ClassDiagram()
+    # files whose objects are in the diagram
+    _in_diagram = set()
+    # names of the expanded packages of the PackageDiagram
+    expanded = set()
+    # held by the threads updating the cache and writing its diagrams
+    lock = Lock()
+
+    def is_changed(self, filepath):
+        '''
+        Return True if the file changed since it was scanned or it
+        wasn't scanned yet
+        '''
+        entry = self.entries.get(filepath)
+        if entry is None:
+            return True
+        try:
+            mtime = os.path.getmtime(filepath)
+            if mtime == entry.mtime:
+                return False
+            if get_digest(filepath) == entry.digest:
+                entry.mtime = mtime
+                return False
+        except (IOError, OSError):
+            pass
+        return True
+
+    def get_changed_files(self):
+        return [filepath for filepath in self.entries.keys() \
+                if self.is_changed(filepath)]
+
+    def update(self, modules, changed):
+        '''
+        Store results of the changed modules and forget modules which are
+        no longer in the project
+        @param modules - all modules of the project
+        @param changed - modules visited by Linker to be extracted again
+        '''
+        filepaths = set(module.file for module in modules if module.file)
+        for filepath in self.entries.keys():
+            if filepath not in filepaths:
+                del self.entries[filepath]
+
+        for module in changed:
+            filepath = module.file
+            entry = ModuleEntry(module.name, filepath, \
+                    os.path.getmtime(filepath), get_digest(filepath))
+            extract_module(module, entry)
+            self.entries[filepath] = entry
+            # objects of the changed module have to be replaced
+            self._in_diagram.discard(filepath)
+
+    def get_diagram(self):
+        '''
+        Return class diagram patched with the changed modules
+        '''
+        for filepath in list(self._in_diagram):
+            if filepath not in self.entries:
+                self.diagram.remove_module(filepath)
+                self._in_diagram.discard(filepath)
+        for filepath, entry in self.entries.iteritems():
+            if filepath not in self._in_diagram:
+                self.diagram.set_module(filepath, entry)
+                self._in_diagram.add(filepath)
+        self.diagram.link(self.entries.values())
+        return self.diagram
+
+    def get_package_diagram(self):
+        '''
+        Return diagram partitioned by packages, only the expanded packages
+        show their classes
+        '''
+        diagram = PackageDiagram()
+        diagram.build(self.get_diagram(), self.entries.values(), \
+                self.expanded)
+        return diagram
+
+    def toggle_package(self, package):
+        '''
+        Expand collapsed package or collapse expanded one
+        '''
+        if package in self.expanded:
+            self.expanded.discard(package)
+        else:
+            self.expanded.add(package)
+
+    def load(self, filename=CACHE_FILE):
+        try:
+            with open(filename, 'rb') as f:
+                content = pickle.load(f)
+        except (IOError, EOFError, AttributeError, pickle.UnpicklingError):
+            return
+        # entries of the older versions are scanned again
+        if isinstance(content, tuple) and content[0] == CACHE_VERSION:
+            self.entries.update(content[1])
+
+    def save(self, filename=CACHE_FILE):
+        with open(filename, 'wb') as f:
+            pickle.dump((CACHE_VERSION, self.entries), f, \
+                    pickle.HIGHEST_PROTOCOL)
+
+scan_cache = ScanCache()
@@ -8,13 +8,34 @@ class IgnoredTags(object):
     Author: Jan Vorcak <vorcak@mail.muni.cz>
     '''
 
+    # filepath => list of ignored errors, this is what gets pickled
     ignored = {}
+    # filepath => set of ignored errors
+    _errors = {}
+    # filepath => set of (msg_id, col_offset, obj, msg) of ignored errors,
+    # line is not the part of the key, so errors stay ignored when the code
+    # above them changes
+    _keys = {}
 
     def add_tag(self, filepath, error):
-        if not self.ignored.has_key(filepath):
-            self.ignored[filepath] = []
-        if error not in self.ignored[filepath]:
-            self.ignored[filepath].append(error)
+        errors = self._errors.setdefault(filepath, set())
+        if error in errors:
+            return
+        sigle, msg_id, line, col_offset, obj, msg, ignored = error
+        errors.add(error)
+        self._keys.setdefault(filepath, set()).add(\
+                (msg_id, col_offset, obj, msg))
+        self.ignored.setdefault(filepath, []).append(error)
+
+    def has_tag(self, filepath, error):
+        return error in self._errors.get(filepath, ())
+
+    def is_ignored(self, filepath, msg_id, col_offset, obj, msg):
+        '''
+        Return True if the message has been marked as ignored in the file
+        '''
+        keys = self._keys.get(filepath)
+        return keys is not None and (msg_id, col_offset, obj, msg) in keys
 
     def get_values(self, filepath):
         if not self.ignored.has_key(filepath):
@@ -23,10 +44,8 @@ class IgnoredTags(object):
 
     def load_errors(self, errors):
         for k in errors.keys():
-            if not self.ignored.has_key(k):
-                self.ignored[k] = []
-            self.ignored[k].extend(errors[k])
-            self.ignored[k] = list(set(self.ignored[k]))
+            for error in errors[k]:
+                self.add_tag(k, tuple(error))
 
 ignored_tags = IgnoredTags()
 
@@ -36,6 +55,9 @@ class Editor(object):
     Class that is used for editing
     """
 
+    # number of changes of the edited text
+    changes = 0
+
     def __init__(self, filename, filepath):
         self.filename = filename
         self.filepath = filepath
@@ -57,8 +79,7 @@ class Editor(object):
         sigle = msg_id[0]
         error = sigle, msg_id, line-1, col_offset, obj, msg, ignored
 
-        # needs to be improved
-        if error in ignored_tags.get_values(self.filepath):
+        if ignored_tags.has_tag(self.filepath, error):
             return
 
         {
@@ -190,6 +211,7 @@ class GeditEditor(Editor):
         self.view.show()
 
     def changed(self, signal):
+        self.changes += 1
         if self.buff.get_modified():
             self._save_button.set_sensitive(True)
 
@@ -268,10 +290,7 @@ class GeditEditor(Editor):
                 (total_errors, total_ignored))
 
     def ignore_current_tag(self):
-        if self.error_tag.error not in \
-               ignored_tags.get_values(self.filepath):
-           ignored_tags.add_tag(self.filepath, \
-                   self.error_tag.error)
+        ignored_tags.add_tag(self.filepath, self.error_tag.error)
 
     def clear_tags(self):
         self.buff.get_tag_table().foreach(self._clear_tags, None)
@@ -1,3 +1,4 @@
+from gpylint.settings import SettingsManager
 from gpylint.settings.PylintMessagesManager import PylintMessagesManager
 from gpylint.settings.GeneralSettingsManager import GeneralSettingsManager
 
@@ -15,6 +16,20 @@ class SettingsFilter(object):
 
         return cls._instance
 
+    # ignored codes and sigles of ignored message types, these are
+    # recomputed only when the settings change
+    _revision = None
+    _ignored_codes = frozenset()
+    _ignored_types = frozenset()
+
+    def compile(self):
+        revision = SettingsManager.revision
+        self._ignored_codes = frozenset(pmm.get_ignored_codes())
+        self._ignored_types = frozenset(gsm.get_ignored_types())
+        self._revision = revision
+
     def code_is_ignored(self, code):
-        return pmm.code_is_ignored(code) or \
-                gsm.code_is_ignored(code)
+        if self._revision != SettingsManager.revision:
+            self.compile()
+        return code in self._ignored_codes or \
+                code[0] in self._ignored_types
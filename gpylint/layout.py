@@ -0,0 +1,547 @@
+'''
+Layout engines deciding about positions of the classes on the canvas
+Engines work directly with node sizes and edges of the diagram, so no
+serialization to the external tools is needed
+'''
+
+import time
+import math
+from random import Random
+from collections import deque
+
+try:
+    import gv
+except ImportError:
+    gv = None
+
+class LayoutEngine(object):
+
+    '''
+    Base class of the layout engines
+    '''
+
+    # horizontal and vertical space between the nodes
+    spacing = 40, 80
+
+    def __init__(self, time_budget=2.0):
+        '''
+        @param time_budget - seconds the engine may spend improving the
+                             layout, the basic layout is always computed
+        '''
+        self.time_budget = time_budget
+        # seconds spent by the last layout
+        self.elapsed = 0.
+
+    def layout(self, nodes, edges):
+        '''
+        Compute position of the nodes
+        @param nodes - dictionary key => (width, height)
+        @param edges - list of (upper key, lower key) tuples, e.g. base
+                       class and its subclass
+        @return dictionary key => (x, y) of the top left corners
+        '''
+        start = time.time()
+        try:
+            return self._layout(nodes, edges, start + self.time_budget)
+        finally:
+            self.elapsed = time.time() - start
+
+    def _layout(self, nodes, edges, deadline):
+        raise NotImplementedError
+
+    def place(self, nodes, edges, pinned):
+        '''
+        Place only nodes which are not pinned, every node is put close to
+        its already placed neighbours, so the cost depends on the number
+        of placed nodes rather than on the size of the diagram
+        @param nodes - dictionary key => (width, height)
+        @param edges - list of (upper key, lower key) tuples
+        @param pinned - dictionary key => (x, y) of the nodes which keep
+                        their positions
+        @return dictionary key => (x, y) of the nodes which are not pinned
+        '''
+        start = time.time()
+        try:
+            return self._place_free(nodes, edges, pinned)
+        finally:
+            self.elapsed = time.time() - start
+
+    def _place_free(self, nodes, edges, pinned):
+        hspace, vspace = self.spacing
+        succs, preds, isolated = get_graph(nodes, edges)
+        occupancy = Occupancy()
+        positions = {}
+        bottom = 0
+        for key, (x, y) in pinned.iteritems():
+            width, height = nodes[key]
+            occupancy.add(x, y, width, height)
+            positions[key] = x, y
+            bottom = max(bottom, y + height)
+
+        pending = set(key for key in nodes if key not in pinned)
+        # nodes next to the placed ones go first
+        queue = deque(sorted(key for key in pending \
+                if any(n in positions for n in succs[key] + preds[key])))
+        placed = {}
+        while pending:
+            if queue:
+                key = queue.popleft()
+                if key not in pending:
+                    continue
+            else:
+                # nothing placed around, start below the diagram
+                key = min(pending)
+            width, height = nodes[key]
+            x, y = self._get_target(key, nodes, succs, preds, positions, \
+                    bottom + vspace)
+            x, y = occupancy.find_free(x, y, width, height, \
+                    width / 2. + hspace, height + vspace, hspace / 2.)
+            occupancy.add(x, y, width, height)
+            positions[key] = placed[key] = x, y
+            bottom = max(bottom, y + height)
+            pending.discard(key)
+            for n in succs[key] + preds[key]:
+                if n in pending:
+                    queue.append(n)
+        return placed
+
+    def _get_target(self, key, nodes, succs, preds, positions, bottom):
+        '''
+        Return preferred position of the node, below its placed upper
+        neighbours, above its placed lower neighbours, or below the diagram
+        '''
+        hspace, vspace = self.spacing
+        width, height = nodes[key]
+        uppers = [n for n in preds[key] if n in positions]
+        lowers = [n for n in succs[key] if n in positions]
+        neighbours = uppers + lowers
+        if not neighbours:
+            return 0, bottom
+        centers = [positions[n][0] + nodes[n][0] / 2. for n in neighbours]
+        x = sum(centers) / len(centers) - width / 2.
+        if uppers:
+            y = max(positions[n][1] + nodes[n][1] for n in uppers) + vspace
+        else:
+            y = min(positions[n][1] for n in lowers) - vspace - height
+        return x, y
+
+    def _grid(self, nodes, keys, top):
+        '''
+        Place nodes without edges in rows below the rest of the diagram
+        '''
+        positions = {}
+        if not keys:
+            return positions
+        hspace, vspace = self.spacing
+        row_width = max(1000, int(math.sqrt(len(keys))) * 200)
+        x = y = 0
+        row_height = 0
+        for key in sorted(keys):
+            width, height = nodes[key]
+            if x and x + width > row_width:
+                x = 0
+                y += row_height + vspace
+                row_height = 0
+            positions[key] = x, top + y
+            x += width + hspace
+            row_height = max(row_height, height)
+        return positions
+
+def get_graph(nodes, edges):
+    '''
+    Return (successors, predecessors, isolated) of the graph, duplicated
+    edges and loops are skipped
+    '''
+    succs = dict((key, []) for key in nodes)
+    preds = dict((key, []) for key in nodes)
+    seen = set()
+    for upper, lower in edges:
+        if upper == lower or (upper, lower) in seen or \
+                upper not in nodes or lower not in nodes:
+            continue
+        seen.add((upper, lower))
+        succs[upper].append(lower)
+        preds[lower].append(upper)
+    isolated = set(key for key in nodes if not succs[key] and not preds[key])
+    return succs, preds, isolated
+
+class Occupancy(object):
+
+    '''
+    Rectangles occupied by the placed nodes, indexed by grid cells
+    '''
+
+    cell_size = 200
+    max_rings = 50
+
+    def __init__(self):
+        # (column, row) => list of (x, y, width, height)
+        self.cells = {}
+
+    def _cells(self, x, y, width, height):
+        size = self.cell_size
+        for column in range(int(x // size), int((x + width) // size) + 1):
+            for row in range(int(y // size), int((y + height) // size) + 1):
+                yield column, row
+
+    def add(self, x, y, width, height):
+        for cell in self._cells(x, y, width, height):
+            self.cells.setdefault(cell, []).append((x, y, width, height))
+
+    def overlaps(self, x, y, width, height, margin=0):
+        x, y = x - margin, y - margin
+        width, height = width + 2 * margin, height + 2 * margin
+        for cell in self._cells(x, y, width, height):
+            for ox, oy, owidth, oheight in self.cells.get(cell, ()):
+                if x < ox + owidth and ox < x + width and \
+                        y < oy + oheight and oy < y + height:
+                    return True
+        return False
+
+    def find_free(self, x, y, width, height, step_x, step_y, margin=0):
+        '''
+        Return the closest free position searching in rings around (x, y),
+        (x, y) is returned when no free position is found
+        '''
+        for ring in range(self.max_rings):
+            candidates = [(i, j) for i in range(-ring, ring + 1) \
+                    for j in range(-ring, ring + 1) \
+                    if max(abs(i), abs(j)) == ring]
+            candidates.sort(key=lambda (i, j): \
+                    (i * step_x) ** 2 + (j * step_y) ** 2)
+            for i, j in candidates:
+                cx, cy = x + i * step_x, y + j * step_y
+                if not self.overlaps(cx, cy, width, height, margin):
+                    return cx, cy
+        return x, y
+
+class LayeredLayout(LayoutEngine):
+
+    '''
+    Sugiyama style layered layout, upper nodes of the edges are placed in
+    the upper layers and the order of nodes in the layers is improved by
+    the barycenter heuristic while time budget allows it
+    The time budget is a soft limit, cycle removal, layering and placement
+    always run, splitting of long edges and ordering stop when the budget
+    is exhausted
+    '''
+
+    max_sweeps = 24
+
+    def _layout(self, nodes, edges, deadline):
+        succs, preds, isolated = get_graph(nodes, edges)
+        keys = sorted(key for key in nodes if key not in isolated)
+
+        self._remove_cycles(keys, succs, preds)
+        layer_of = self._assign_layers(keys, succs, preds)
+        # the rest of the budget is left for ordering and for placement of
+        # the dummy nodes
+        now = time.time()
+        layers = self._add_dummies(keys, succs, preds, layer_of, \
+                now + (deadline - now) / 3.)
+        self._order(layers, succs, preds, deadline)
+        positions, bottom = self._place(layers, nodes)
+
+        positions.update(self._grid(nodes, isolated, bottom))
+        return positions
+
+    def _remove_cycles(self, keys, succs, preds):
+        '''
+        Reverse edges closing cycles found by depth first search
+        '''
+        state = {}
+        for root in keys:
+            if root in state:
+                continue
+            state[root] = 1
+            stack = [(root, iter(list(succs[root])))]
+            while stack:
+                key, children = stack[-1]
+                for child in children:
+                    if state.get(child) == 1:
+                        # back edge
+                        succs[key].remove(child)
+                        preds[child].remove(key)
+                        if key not in succs[child]:
+                            succs[child].append(key)
+                            preds[key].append(child)
+                    elif child not in state:
+                        state[child] = 1
+                        stack.append((child, iter(list(succs[child]))))
+                        break
+                else:
+                    state[key] = 2
+                    stack.pop()
+
+    def _assign_layers(self, keys, succs, preds):
+        '''
+        Longest path layering, every node is placed one layer below its
+        lowest predecessor
+        '''
+        layer_of = {}
+        indegree = dict((key, len(preds[key])) for key in keys)
+        queue = [key for key in keys if not indegree[key]]
+        while queue:
+            key = queue.pop()
+            layer_of[key] = max([layer_of[pred] + 1 for pred in preds[key]] \
+                    or [0])
+            for succ in succs[key]:
+                indegree[succ] -= 1
+                if not indegree[succ]:
+                    queue.append(succ)
+        return layer_of
+
+    def _add_dummies(self, keys, succs, preds, layer_of, deadline):
+        '''
+        Split edges longer than one layer by dummy nodes, edges visited
+        after the deadline are left long, so they don't take part in
+        ordering
+        @return list of layers, every layer is a list of keys
+        '''
+        count = max(layer_of.values() or [-1]) + 1
+        layers = [[] for i in range(count)]
+        for key in keys:
+            layers[layer_of[key]].append(key)
+
+        for upper in keys:
+            for lower in list(succs[upper]):
+                span = layer_of[lower] - layer_of[upper]
+                if span < 2 or time.time() > deadline:
+                    continue
+                succs[upper].remove(lower)
+                preds[lower].remove(upper)
+                previous = upper
+                for layer in range(layer_of[upper] + 1, layer_of[lower]):
+                    dummy = Dummy()
+                    layers[layer].append(dummy)
+                    succs[dummy] = []
+                    preds[dummy] = [previous]
+                    succs[previous].append(dummy)
+                    previous = dummy
+                succs[previous].append(lower)
+                preds[lower].append(previous)
+        return layers
+
+    def _order(self, layers, succs, preds, deadline):
+        '''
+        Reorder nodes in the layers to reduce edge crossings
+        '''
+        for sweep in range(self.max_sweeps):
+            if time.time() > deadline:
+                break
+            changed = False
+            if sweep % 2:
+                steps = [(i, i + 1, succs) \
+                        for i in range(len(layers) - 2, -1, -1)]
+            else:
+                steps = [(i, i - 1, preds) for i in range(1, len(layers))]
+            for i, fixed, neighbours in steps:
+                # big layers take long to sort, the budget is checked
+                # before every layer
+                if time.time() > deadline:
+                    return
+                changed |= self._sort_layer(layers, i, fixed, neighbours)
+            if not changed and sweep:
+                break
+
+    def _sort_layer(self, layers, i, fixed, neighbours):
+        index = dict((key, j) for j, key in enumerate(layers[fixed]))
+        layer = layers[i]
+        barycenters = {}
+        for j, key in enumerate(layer):
+            positions = [index[n] for n in neighbours[key] if n in index]
+            if positions:
+                barycenters[key] = float(sum(positions)) / len(positions)
+            else:
+                barycenters[key] = j
+        ordered = sorted(layer, key=barycenters.get)
+        if ordered == layer:
+            return False
+        layers[i] = ordered
+        return True
+
+    def _place(self, layers, nodes):
+        '''
+        Compute coordinates, layers are centered horizontally
+        @return tuple (positions, bottom of the lowest layer)
+        '''
+        hspace, vspace = self.spacing
+        widths = []
+        for layer in layers:
+            widths.append(sum(self._size(key, nodes)[0] + hspace \
+                    for key in layer))
+        total = max(widths or [0])
+
+        positions = {}
+        y = 0
+        for layer, width in zip(layers, widths):
+            x = (total - width) / 2.
+            height = 0
+            for key in layer:
+                node_width, node_height = self._size(key, nodes)
+                if not isinstance(key, Dummy):
+                    positions[key] = x, y
+                x += node_width + hspace
+                height = max(height, node_height)
+            y += height + vspace
+        return positions, y
+
+    def _size(self, key, nodes):
+        if isinstance(key, Dummy):
+            return Dummy.size
+        return nodes[key]
+
+class Dummy(object):
+
+    '''
+    Node splitting edges which cross more than one layer
+    '''
+
+    size = 10, 0
+
+class ForceDirectedLayout(LayoutEngine):
+
+    '''
+    Fruchterman-Reingold force directed layout
+    Repulsive forces are computed just between nodes in the neighbouring
+    grid cells, iterations stop when the time budget is exhausted
+    '''
+
+    iterations = 200
+
+    def _layout(self, nodes, edges, deadline):
+        succs, preds, isolated = get_graph(nodes, edges)
+        keys = sorted(key for key in nodes if key not in isolated)
+        if not keys:
+            return self._grid(nodes, isolated, 0)
+
+        size = max(max(nodes[key]) for key in keys) + self.spacing[0]
+        k = size * 1.5
+        side = k * math.sqrt(len(keys))
+        random = Random(0)
+        pos = dict((key, [random.uniform(0, side), random.uniform(0, side)]) \
+                for key in keys)
+        pairs = [(upper, lower) for upper in keys for lower in succs[upper]]
+
+        temperature = side / 10.
+        for iteration in range(self.iterations):
+            if time.time() > deadline:
+                break
+            disp = dict((key, [0., 0.]) for key in keys)
+
+            # repulsion between nodes of the neighbouring cells
+            cells = {}
+            for key in keys:
+                x, y = pos[key]
+                cells.setdefault((int(x // (2 * k)), int(y // (2 * k))), \
+                        []).append(key)
+            for (cx, cy), cell in cells.iteritems():
+                near = []
+                for dx in (-1, 0, 1):
+                    for dy in (-1, 0, 1):
+                        near.extend(cells.get((cx + dx, cy + dy), ()))
+                for v in cell:
+                    vx, vy = pos[v]
+                    d = disp[v]
+                    for u in near:
+                        if u is v:
+                            continue
+                        ddx = vx - pos[u][0]
+                        ddy = vy - pos[u][1]
+                        dist = math.hypot(ddx, ddy) or 0.01
+                        force = k * k / dist
+                        d[0] += ddx / dist * force
+                        d[1] += ddy / dist * force
+
+            # attraction along the edges
+            for upper, lower in pairs:
+                ddx = pos[upper][0] - pos[lower][0]
+                ddy = pos[upper][1] - pos[lower][1]
+                dist = math.hypot(ddx, ddy) or 0.01
+                force = dist * dist / k
+                fx, fy = ddx / dist * force, ddy / dist * force
+                disp[upper][0] -= fx
+                disp[upper][1] -= fy
+                disp[lower][0] += fx
+                disp[lower][1] += fy
+
+            for key in keys:
+                dx, dy = disp[key]
+                length = math.hypot(dx, dy)
+                if length:
+                    step = min(length, temperature)
+                    pos[key][0] += dx / length * step
+                    pos[key][1] += dy / length * step
+            temperature *= 0.95
+
+        # move the diagram to the positive coordinates
+        left = min(pos[key][0] for key in keys)
+        top = min(pos[key][1] for key in keys)
+        positions = {}
+        bottom = 0
+        for key in keys:
+            width, height = nodes[key]
+            x = pos[key][0] - left
+            y = pos[key][1] - top
+            positions[key] = x, y
+            bottom = max(bottom, y + height)
+        positions.update(self._grid(nodes, isolated, \
+                bottom + self.spacing[1]))
+        return positions
+
+class GraphvizLayout(LayoutEngine):
+
+    '''
+    Layout computed by graphviz dot, available only if graphviz python
+    bindings are installed
+    '''
+
+    # graphviz uses inches for sizes and points for positions
+    DPI = 72.
+
+    def _layout(self, nodes, edges, deadline):
+        keys = sorted(nodes)
+        ids = dict((key, i) for i, key in enumerate(keys))
+        source = ['digraph g {', 'node [shape=box, fixedsize=true];']
+        for key in keys:
+            width, height = nodes[key]
+            source.append('"%d" [width=%f, height=%f];' % \
+                    (ids[key], width / self.DPI, height / self.DPI))
+        for upper, lower in edges:
+            if upper in ids and lower in ids:
+                source.append('"%d" -> "%d";' % (ids[upper], ids[lower]))
+        source.append('}')
+
+        g = gv.readstring('\n'.join(source))
+        gv.layout(g, 'dot')
+        gv.render(g)
+
+        positions = {}
+        node = gv.firstnode(g)
+        while node is not None:
+            key = keys[int(gv.nameof(node))]
+            x, y = map(float, gv.getv(node, 'pos').split(','))
+            width, height = nodes[key]
+            # graphviz returns centers of the nodes with y axis upwards
+            positions[key] = x - width / 2., -y - height / 2.
+            node = gv.nextnode(g, node)
+
+        top = min([y for x, y in positions.values()] or [0])
+        for key, (x, y) in positions.items():
+            positions[key] = x, y - top
+        return positions
+
+LAYOUT_ENGINES = {
+        'layered': LayeredLayout,
+        'force': ForceDirectedLayout,
+        }
+
+if gv is not None:
+    LAYOUT_ENGINES['graphviz'] = GraphvizLayout
+
+def get_layout_engine(name, time_budget=2.0):
+    '''
+    Return instance of the layout engine, layered layout is used when
+    the engine is not available
+    '''
+    return LAYOUT_ENGINES.get(name, LayeredLayout)(time_budget)
@@ -1,17 +1,30 @@
 import os
-from gi.repository import Gdk
-from threading import Thread
+import sys
+import logging
+import traceback
+from gi.repository import Gdk, GLib
+from threading import Thread, Lock
+from multiprocessing import Process, Queue
+from Queue import Empty
 from StringIO import StringIO
 
 from pylint.lint import PyLinter
-from pylint.utils import PyLintASTWalker, expand_modules
-from pylint.interfaces import IASTNGChecker, IRawChecker
+from pylint.reporters import BaseReporter
+from pylint.utils import PyLintASTWalker, expand_modules, MSG_TYPES
+from pylint.interfaces import IASTNGChecker, IRawChecker, IReporter
 
 from logilab.common.interface import implements
 from logilab.astng.builder import ASTNGBuilder
 from logilab.astng import MANAGER
 
 from gpylint.scanner import BlackList
+from gpylint.cache import lint_cache, RecordingReporter
+
+# events sent from the worker processes to the ProjectLinter
+MODULE_EVENT, MESSAGE_EVENT, CACHE_EVENT, STATS_EVENT, ERROR_EVENT, \
+        DONE_EVENT = range(6)
+
+logger = logging.getLogger('main')
 
 class IgnoreLinter(PyLinter):
 
@@ -22,11 +35,22 @@ class IgnoreLinter(PyLinter):
     i = 0.
     files_to_process = property(lambda x: len(x.result))
 
+    use_cache = True
+    _salt = None
+    _cache_key = None
+    # module path => description of the module returned by expand_files
+    _descrs = {}
+
+    def set_reporter(self, reporter):
+        # messages are recorded so they can be stored in the lint cache
+        super(IgnoreLinter, self).set_reporter(RecordingReporter(reporter))
+
     def expand_files(self, modules):
         """get modules and errors from a list of modules and handle errors
         """
         result, errors = expand_modules(modules, [''])
         self.result = result = filter(self.blacklist_result, result)
+        self._descrs = dict((descr['path'], descr) for descr in result)
         for error in errors:
             message = modname = error["mod"]
             key = error["key"]
@@ -45,42 +69,408 @@ class IgnoreLinter(PyLinter):
         self.i += 1
         self.reporter.update_progressbar(self.i/self.files_to_process)
 
-class GPyLinter(Thread):
+    def replay_cached(self, filepath, modname):
+        '''
+        Pass cached messages of the module to the reporter
+        Return True if the module was found in the cache, False otherwise
+        '''
+        if not self.use_cache:
+            return False
+        if self._salt is None:
+            self._salt = lint_cache.get_salt(self.config_file, \
+                    [checker.name for checker in self.prepare_checkers()])
+        self._cache_key = lint_cache.get_key(filepath, modname, self._salt)
+        messages = lint_cache.get(self._cache_key)
+        if messages is None:
+            return False
+        for msg_id, location, msg in messages:
+            self.count_message(msg_id, modname)
+            self.reporter.add_message(msg_id, location, msg)
+        return True
+
+    def count_message(self, msg_id, modname):
+        '''
+        Count the replayed message in the statistics as PyLinter.add_message
+        does for the checked modules
+        '''
+        msg_cat = MSG_TYPES[msg_id[0]]
+        by_module = self.stats['by_module'].setdefault(modname, \
+                dict.fromkeys(['statement'] + MSG_TYPES.values(), 0))
+        self.stats[msg_cat] += 1
+        by_module[msg_cat] += 1
+        self.stats['by_msg'][msg_id] = self.stats['by_msg'].get(msg_id, 0) + 1
+
+    def get_astng(self, filepath, modname):
+        # unchanged modules are not parsed and checked again, the base
+        # module is set like for the checked ones, otherwise no reports
+        # are made when all modules are cached
+        if self.replay_cached(filepath, modname):
+            descr = self._descrs.get(filepath)
+            if descr is not None:
+                self.base_name = descr['basename']
+                self.base_file = descr['basepath']
+            return None
+        return super(IgnoreLinter, self).get_astng(filepath, modname)
+
+    def check_astng_module(self, astng, walker, rawcheckers):
+        self.reporter.recorded = []
+        try:
+            super(IgnoreLinter, self).check_astng_module(astng, walker, \
+                    rawcheckers)
+            self.store_messages(self._cache_key, self.reporter.recorded)
+        finally:
+            self.reporter.recorded = None
+
+    def store_messages(self, key, messages):
+        lint_cache.set(key, messages)
+
+    def reset_state(self):
+        '''
+        Reset state of the previous check, used when the linter is reused
+        '''
+        self.i = 0.
+        self.use_cache = True
+        self._salt = None
+        self._cache_key = None
+        self._descrs = {}
 
-    linter = None
+class QueueReporter(BaseReporter):
 
-    def __init__(self):
-        super(GPyLinter, self).__init__()
+    '''
+    Reporter used by the worker processes, it doesn't display anything but
+    sends messages and progress to the queue read by ProjectLinter
+    '''
+
+    __implements__ = IReporter
+
+    def __init__(self, queue):
+        BaseReporter.__init__(self, sys.stdout)
+        self.queue = queue
 
-    def init_linter(self, reporter, pylintrc):
+    def update_progressbar(self, ratio):
+        # progress is sent by WorkerLinter for every checked module
         pass
 
-    def load_default_plugins(self):
-        self.linter.load_default_plugins()
+    def add_message(self, msg_id, location, msg):
+        self.queue.put((MESSAGE_EVENT, (msg_id, location, msg)))
+
+    def display_results(self, sect):
+        pass
+
+class WorkerLinter(IgnoreLinter):
+
+    '''
+    IgnoreLinter running in the worker process, the messages to be cached
+    are sent to the parent process
+    '''
+
+    def __init__(self, queue, pylintrc=None, use_cache=True):
+        self.queue = queue
+        self.use_cache = use_cache
+        super(WorkerLinter, self).__init__(reporter=QueueReporter(queue), \
+                pylintrc=pylintrc)
+
+    def set_current_module(self, modname, filepath=None):
+        super(WorkerLinter, self).set_current_module(modname, filepath)
+        # only modules sent to the worker are counted, not the errors of
+        # expand_files or the end of the check
+        if filepath in self._descrs:
+            self.queue.put((MODULE_EVENT, filepath))
+
+    def store_messages(self, key, messages):
+        self.queue.put((CACHE_EVENT, (key, messages)))
+
+def lint_worker(modules, pylintrc, plugins, blacklist, use_cache, queue):
+    '''
+    Entry point of the worker process, runs IgnoreLinter on the given shard
+    of the project modules
+    @param modules - list of module paths to be checked
+    @param pylintrc - pylintrc used by the parent linter
+    @param plugins - list of plugin modules to be loaded
+    @param blacklist - list of ignored paths
+    @param use_cache - whether cached messages may be used
+    @param queue - queue the results are sent to
+    '''
+    try:
+        BlackList.blacklist = blacklist
+        linter = WorkerLinter(queue, pylintrc=pylintrc, use_cache=use_cache)
+        linter.load_default_plugins()
+        linter.load_plugin_modules(plugins)
+        linter.read_config_file()
+        linter.load_config_file()
+        # results are saved by the parent from the merged statistics
+        linter.config.persistent = False
+        linter.check(modules)
+        queue.put((STATS_EVENT, linter.stats))
+    except Exception:
+        queue.put((ERROR_EVENT, (os.getpid(), traceback.format_exc())))
+    finally:
+        queue.put((DONE_EVENT, os.getpid()))
+
+def merge_stats(stats, other):
+    '''
+    Add statistics of a worker linter to the statistics of the linter
+    '''
+    for key, value in other.iteritems():
+        if key not in stats:
+            stats[key] = value
+        elif isinstance(value, dict):
+            merge_stats(stats[key], value)
+        elif isinstance(value, set):
+            stats[key] |= value
+        elif isinstance(value, list):
+            stats[key].extend(value)
+        elif isinstance(value, (int, long, float)):
+            stats[key] += value
+        else:
+            stats[key] = value
+
+class LinterPool(object):
+
+    '''
+    Pool of initialized linters
+    Checkers are loaded and configuration is read just once for every
+    linter class, pylintrc and list of plugins, linters are borrowed for
+    a single check and given back when the check is finished
+    '''
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(LinterPool, cls).__new__(\
+                    cls, *args, **kwargs)
+
+        return cls._instance
+
+    # (linter class, pylintrc, plugins) => list of idle linters
+    linters = {}
+    # maximal number of idle linters kept for every key
+    max_idle = 4
+    _lock = Lock()
+
+    def borrow(self, linter_class, reporter, pylintrc=None, plugins=()):
+        '''
+        Return linter with loaded checkers and configuration
+        @param linter_class - PyLinter or its subclass
+        @param reporter - reporter used by the linter
+        @param pylintrc - pylintrc to be used
+        @param plugins - list of plugin modules to be loaded
+        '''
+        key = linter_class, pylintrc, tuple(plugins)
+        with self._lock:
+            idle = self.linters.get(key)
+            linter = idle.pop() if idle else None
+
+        if linter is None:
+            linter = linter_class(reporter=reporter, pylintrc=pylintrc)
+            linter.load_default_plugins()
+            linter.load_plugin_modules(plugins)
+            linter.read_config_file()
+            linter.load_config_file()
+            linter.pool_key = key
+        else:
+            linter.set_reporter(reporter)
+            if hasattr(linter, 'reset_state'):
+                linter.reset_state()
+        return linter
+
+    def give_back(self, linter):
+        with self._lock:
+            idle = self.linters.setdefault(linter.pool_key, [])
+            if len(idle) < self.max_idle:
+                idle.append(linter)
+
+class GPyLinter(Thread):
+
+    linter = None
+    linter_class = PyLinter
 
-    def read_config_file(self):
-        self.linter.read_config_file()
+    def __init__(self):
+        super(GPyLinter, self).__init__()
 
-    def load_plugin_modules(self, plugins):
-        self.linter.load_plugin_modules(plugins)
+    def init_linter(self, reporter, pylintrc, plugins=()):
+        '''
+        Borrow linter from the pool
+        @param reporter - reporter used by the linter
+        @param pylintrc - pylintrc to be used
+        @param plugins - list of plugin modules to be loaded
+        '''
+        self.reporter = reporter
+        self.pylintrc = pylintrc
+        self.plugins = plugins
+        self.linter = LinterPool().borrow(self.linter_class, reporter, \
+                pylintrc, plugins)
 
-    def load_config_file(self):
-        self.linter.load_config_file()
+    def release_linter(self):
+        '''
+        Give the linter back to the pool, it mustn't be used afterwards
+        '''
+        LinterPool().give_back(self.linter)
 
     def run(self):
         pass
 
 class ProjectLinter(GPyLinter):
-    
-    def init_linter(self, reporter, pylintrc):
-        self.linter = IgnoreLinter(reporter=reporter, pylintrc=pylintrc)
-    
+
+    linter_class = IgnoreLinter
+    jobs = 1
+    modules = None
+    # seconds waited for an event of the workers before they're checked
+    poll_interval = 1
+
     def set_project_path(self, project_path):
         self.project_path = project_path
 
+    def set_modules(self, modules):
+        '''
+        Check only the given module paths instead of the whole project
+        '''
+        self.modules = modules
+
+    def set_use_cache(self, use_cache):
+        '''
+        Turn off replaying of cached messages, modules are always checked
+        and the cache is updated with new results
+        '''
+        self.linter.use_cache = use_cache
+
+    def set_jobs(self, jobs):
+        '''
+        Set number of worker processes used for linting the project
+        '''
+        self.jobs = max(1, jobs)
+
     def run(self):
-        args = self.linter.load_command_line_configuration([self.project_path])
-        self.linter.check(args)
+        try:
+            args = self.linter.load_command_line_configuration(\
+                    self.modules or [self.project_path])
+            if self.jobs > 1:
+                self.parallel_check(args)
+            else:
+                self.linter.check(args)
+        finally:
+            self.release_linter()
+        logger.info('Lint cache statistics: %s' % lint_cache.get_stats())
+
+    def parallel_check(self, args):
+        '''
+        Shard the expanded modules across worker processes and pass their
+        results to the reporter of this linter
+        @param args - files or modules to be checked
+        '''
+        reporter = self.linter.reporter
+        # checkers are opened and closed like in PyLinter.check, so reports
+        # are made from the replayed messages and the merged statistics of
+        # the workers
+        checkers = self.linter.prepare_checkers()
+        for checker in checkers:
+            checker.open()
+        self.linter.stats['statement'] = 0
+        descrs = self.linter.expand_files(args)
+        names = dict((descr['path'], descr['name']) for descr in descrs)
+        total = len(descrs)
+
+        # cached modules are replayed here, the rest is sent to workers
+        modules = []
+        done = 0.
+        for descr in descrs:
+            if self.linter.replay_cached(descr['path'], descr['name']):
+                done += 1
+                reporter.update_progressbar(done / total)
+            else:
+                modules.append(descr['path'])
+        shards = [modules[i::self.jobs] for i in range(self.jobs)]
+
+        queue = Queue()
+        # pid => worker process
+        workers = {}
+        # pid => paths of the modules the worker hasn't finished
+        unfinished = {}
+        # module path => pid of the worker checking it
+        owners = {}
+        for shard in shards:
+            if not shard:
+                continue
+            worker = Process(target=lint_worker, args=(shard, \
+                    self.pylintrc, self.plugins, BlackList.blacklist, \
+                    self.linter.use_cache, queue))
+            worker.start()
+            workers[worker.pid] = worker
+            unfinished[worker.pid] = set(shard)
+            owners.update((filepath, worker.pid) for filepath in shard)
+
+        # pid => module the worker checks now
+        current = {}
+        # pids of the workers which sent an error
+        errors = set()
+        # pids of the workers found dead before waiting for the events
+        dead = set()
+        while unfinished:
+            try:
+                event, data = queue.get(timeout=self.poll_interval)
+            except Empty:
+                # events sent by these workers were read already, they died
+                # without finishing their modules
+                for pid in dead:
+                    failed = unfinished.pop(pid)
+                    done += len(failed - set([current.get(pid)]))
+                    reason = 'lint worker died with exit code %s' % \
+                            workers[pid].exitcode
+                    logger.error(reason)
+                    self.report_failed(failed, names, reason)
+                    reporter.update_progressbar(done / total)
+            else:
+                if event == MESSAGE_EVENT:
+                    reporter.add_message(*data)
+                elif event == MODULE_EVENT:
+                    pid = owners[data]
+                    # the previous module of the worker is finished
+                    unfinished[pid].discard(current.get(pid))
+                    current[pid] = data
+                    done += 1
+                    reporter.update_progressbar(done / total)
+                elif event == CACHE_EVENT:
+                    lint_cache.set(*data)
+                elif event == STATS_EVENT:
+                    merge_stats(self.linter.stats, data)
+                elif event == ERROR_EVENT:
+                    pid, error = data
+                    errors.add(pid)
+                    logger.error('Lint worker failed, messages of its ' \
+                            'modules are missing:\n%s' % error)
+                else:
+                    failed = unfinished.pop(data)
+                    if data in errors:
+                        done += len(failed - set([current.get(data)]))
+                        self.report_failed(failed, names, \
+                                'lint worker failed')
+                        reporter.update_progressbar(done / total)
+            dead = set(pid for pid in unfinished \
+                    if not workers[pid].is_alive())
+
+        for worker in workers.values():
+            worker.join()
+
+        if descrs:
+            self.linter.base_name = descrs[-1]['basename']
+            self.linter.base_file = descrs[-1]['basepath']
+        checkers.reverse()
+        for checker in checkers:
+            checker.close()
+
+    def report_failed(self, modules, names, reason):
+        '''
+        Report modules which weren't checked because their worker failed
+        @param modules - paths of the modules
+        @param names - dictionary module path => module name
+        @param reason - message describing the failure
+        '''
+        for filepath in modules:
+            modname = names[filepath]
+            self.linter.count_message('F0001', modname)
+            self.linter.reporter.add_message('F0001', \
+                    (filepath, modname, '', 1, 0), reason)
 
 class TextBufferLinter(GPyLinter):
 
@@ -89,21 +479,45 @@ class TextBufferLinter(GPyLinter):
     Author: Jan Vorcak <vorcak@mail.muni.cz>
     '''
 
-    def init_linter(self, reporter, pylintrc):
-        self.linter = PyLinter(reporter=reporter, pylintrc=pylintrc)
+    cancelled = False
+    changes = 0
+    finished_callback = None
 
-    def set_buffer(self, buff):
+    def set_buffer(self, buff, changes=0):
+        '''
+        Set the buffer to be checked, its current text is checked even if
+        the buffer is changed while the check is running
+        @param changes - change counter of the buffer when its text was
+                         taken, see Editor.changes
+        '''
         self.buff = buff
+        self.changes = changes
+        self.source = buff.get_text(buff.get_start_iter(), \
+                buff.get_end_iter(), True)
 
     def set_scanning_items(self, label, spinner):
         self.label = label
         self.spinner = spinner
 
+    def set_finished_callback(self, callback):
+        '''
+        Set function called from the main loop when the check is finished
+        or cancelled, the linter is passed as an argument
+        '''
+        self.finished_callback = callback
+
+    def cancel(self):
+        '''
+        Cancel the check, it stops as soon as possible and messages found
+        after cancelling are not reported
+        '''
+        self.cancelled = True
+        self.reporter.cancelled = True
+
     def run(self):
         '''
         Author: Jan Vorcak <vorcak@mail.muni.cz>
         Run pylint on input from GtkTextBuffer
-        @param buff - instance of GtkTextBuffer to be checked
         '''
 
         Gdk.threads_enter()
@@ -111,6 +525,18 @@ class TextBufferLinter(GPyLinter):
         self.label.set_visible(True)
         Gdk.threads_leave()
 
+        try:
+            self.check_source(self.source)
+        finally:
+            self.release_linter()
+            Gdk.threads_enter()
+            self.spinner.set_visible(False)
+            self.label.set_visible(False)
+            Gdk.threads_leave()
+            if self.finished_callback is not None:
+                GLib.idle_add(self.finished_callback, self)
+
+    def check_source(self, source):
         walker = PyLintASTWalker(self.linter)
 
         # prepare checkers
@@ -121,8 +547,6 @@ class TextBufferLinter(GPyLinter):
             checker.open()
             if implements(checker, IASTNGChecker):
                 walker.add_checker(checker)
-        source = self.buff.get_text(self.buff.get_start_iter(), \
-                self.buff.get_end_iter(), True)
 
         self.linter.base_name = 'textbuffername'
         self.linter.base_file = 'textbufferpath'
@@ -130,11 +554,14 @@ class TextBufferLinter(GPyLinter):
         self.linter.set_current_module(self.linter.base_name, \
                 self.linter.base_file)
 
+        if self.cancelled:
+            return
+
         astng = ASTNGBuilder(MANAGER).string_build(source, modname='buffer')
+        if astng is None or self.cancelled:
+            return
         astng.file_stream = StringIO(source)
         astng.file_encoding = 'utf8'
-        if astng is None:
-            return
         self.linter.current_name = self.linter.base_name
 
         self.linter.check_astng_module(astng, walker, rawcheckers)
@@ -142,8 +569,3 @@ class TextBufferLinter(GPyLinter):
         checkers.reverse()
         for checker in checkers:
             checker.close()
-
-        Gdk.threads_enter()
-        self.spinner.set_visible(False)
-        self.label.set_visible(False)
-        Gdk.threads_leave()
@@ -1,6 +1,7 @@
 import sys
 
-from gi.repository import Gdk
+from threading import Lock
+from gi.repository import GLib
 
 from pylint.interfaces import IReporter
 from pylint.reporters import BaseReporter
@@ -10,34 +11,34 @@ from gpylint.canvas import CanvasContext
 
 settings_filter = SettingsFilter()
 
-def is_ignored(values, msg_id, line, col_offset, obj, msg):
-    for error in values:
-        _sigle, _msg_id, _line, _col_offset, _obj, _msg, _ignored = error
-        if _msg_id == msg_id and _col_offset == col_offset and \
-                _obj == obj and _msg == msg:
-            return True
-    return False
-
 class EditorReporter(BaseReporter):
     '''
-    Shows pylint messages directly to the source code
+    Shows pylint messages directly to the source code, messages are
+    collected in the lint thread and shown by show_messages from the main
+    loop
     '''
 
     __implements__ = IReporter
     extension = 'txt'
 
+    # set when the check is superseded by a newer one
+    cancelled = False
+
     def __init__(self, editor, output=sys.stdout):
         BaseReporter.__init__(self, output)
         self._editor = editor
         self._ignored_msgs_count = 0
         self._msgs_count = 0
+        self._messages = []
 
     def add_message(self, msg_id, location, msg):
         """manage message of different type and in the context of path"""
+        if self.cancelled:
+            return
         module, obj, line, col_offset = location[1:]
 
-        ignored = is_ignored(ignored_tags.get_values(\
-                self._editor.filepath), msg_id, line, col_offset, obj, msg)
+        ignored = ignored_tags.is_ignored(self._editor.filepath, \
+                msg_id, col_offset, obj, msg)
 
         ignored = ignored or settings_filter.code_is_ignored(msg_id)
 
@@ -46,7 +47,15 @@ class EditorReporter(BaseReporter):
         else:
             self._msgs_count += 1
 
-        self._editor.add_message(msg_id, line, col_offset, obj, msg, ignored)
+        self._messages.append((msg_id, line, col_offset, obj, msg, ignored))
+
+    def show_messages(self):
+        '''
+        Tag collected messages in the editor, has to be called from the
+        main loop
+        '''
+        for message in self._messages:
+            self._editor.add_message(*message)
 
     def display_results(self, sect):
         statistics = {}
@@ -61,36 +70,104 @@ class CanvasReporter(BaseReporter):
 
     __implements__ = IReporter
 
-    def __init__(self, progressbar):
+    # interval of the GUI updates in milliseconds
+    FLUSH_INTERVAL = 100
+
+    def __init__(self, progressbar, filepaths=None):
+        '''
+        @param progressbar - progress bar to be updated or None
+        @param filepaths - paths of the checked files, errors are cleared
+                           just for these files, all errors are cleared
+                           when None
+        '''
         BaseReporter.__init__(self, sys.stdout)
         self.context = CanvasContext().dictionary
+        self.names = CanvasContext().names
         self.progressbar = progressbar
         self.i = 0
+        self._cleared = []
         for class_box in self.context.values():
-            class_box.clear_errors()
+            if filepaths is None or class_box.filepath in filepaths:
+                class_box.clear_errors()
+                self._cleared.append(class_box)
+
+        # events waiting for the flush to the main loop
+        self._lock = Lock()
+        self._ratio = None
+        self._errors = []
+        self._finished = False
+        self._flush_source = None
 
     def update_progressbar(self, ratio):
-        Gdk.threads_enter()
-        self.progressbar.set_fraction(ratio)
-        Gdk.threads_leave()
+        with self._lock:
+            self._ratio = ratio
+            self._schedule_flush()
 
     def add_message(self, msg_id, location, msg):
 
         filepath, module, obj, line, col_offset = location
         if settings_filter.code_is_ignored(msg_id) or \
-                is_ignored(ignored_tags.get_values(filepath), \
-                           msg_id, line, col_offset, obj, msg):
+                ignored_tags.is_ignored(filepath, msg_id, col_offset, \
+                                        obj, msg):
             return
 
-        key = (location[0], obj.split('.')[0]) # (filepath, objectname)
-        if key in self.context:
-            self.context[key].add_error(msg_id)
+        class_box = self.get_class_box(filepath, obj)
+        if class_box is not None:
+            with self._lock:
+                self._errors.append((class_box, msg_id))
+                self._schedule_flush()
+
+    def get_class_box(self, filepath, obj):
+        '''
+        Return box of the innermost class containing the object of the
+        message, None if there's no such box
+        @param obj - name of the object qualified within the module, e.g.
+                     Outer.Inner.method
+        '''
+        parts = obj.split('.')
+        for i in range(len(parts), 0, -1):
+            class_box = self.names.get((filepath, '.'.join(parts[:i])))
+            if class_box is not None:
+                return class_box
+        return None
 
     def display_results(self, sect):
-        Gdk.threads_enter()
-        self.progressbar.set_visible(False)
-
-
-        for class_box in self.context.values():
-           class_box.request_update()
-        Gdk.threads_leave()
+        with self._lock:
+            self._finished = True
+            self._schedule_flush()
+
+    def _schedule_flush(self):
+        '''
+        Schedule flush of the buffered events, has to be called with the
+        lock held
+        '''
+        if self._flush_source is None:
+            self._flush_source = GLib.timeout_add(self.FLUSH_INTERVAL, \
+                    self.flush)
+
+    def flush(self):
+        '''
+        Apply buffered events to the GUI, it's called from the main loop
+        '''
+        with self._lock:
+            ratio, self._ratio = self._ratio, None
+            errors, self._errors = self._errors, []
+            finished = self._finished
+            self._flush_source = None
+
+        if ratio is not None and self.progressbar is not None:
+            self.progressbar.set_fraction(ratio)
+
+        updated = set()
+        for class_box, msg_id in errors:
+            class_box.add_error(msg_id)
+            updated.add(class_box)
+
+        if finished:
+            if self.progressbar is not None:
+                self.progressbar.set_visible(False)
+            updated.update(self._cleared)
+
+        for class_box in updated:
+            class_box.request_update()
+        return False
@@ -1,16 +1,19 @@
 import sys, os
 
-from gi.repository import Gdk
+from gi.repository import GLib
 from threading import Thread
 from logilab.common.configuration import ConfigurationMixIn
 from logilab.astng.manager import ASTNGManager
 from logilab.astng.inspector import Linker
 
 from pylint.pyreverse.main import OPTIONS
-from pylint.pyreverse.diadefslib import DiadefsHandler
 from pylint.pyreverse.utils import insert_default_options
 
 import writer
+from diagrams import scan_cache
+from gpylint.settings.GeneralSettingsManager import GeneralSettingsManager
+
+gsm = GeneralSettingsManager()
 
 class BlackList(object):
 
@@ -30,6 +33,62 @@ class BlackList(object):
 
     blacklist = []
 
+class ImportGraph(object):
+
+    '''
+    Index of imports between the project modules, it's built while scanning
+    the project and used to find modules affected by the change of a file
+    '''
+
+    _instance = None
+
+    def __new__(cls, *args, **kwargs):
+        if not cls._instance:
+            cls._instance = super(ImportGraph, cls).__new__(\
+                    cls, *args, **kwargs)
+
+        return cls._instance
+
+    # module name => file path
+    modules = {}
+    # absolute file path => module name
+    files = {}
+    # module name => set of names of modules importing it
+    dependents = {}
+
+    def update(self, modules):
+        '''
+        Rebuild the index from the modules tagged with their dependencies
+        '''
+        self.modules.clear()
+        self.files.clear()
+        self.dependents.clear()
+        for module in modules:
+            self.modules[module.name] = module.file
+            self.files[os.path.abspath(module.file)] = module.name
+            for name in getattr(module, 'depends', []):
+                self.dependents.setdefault(name, set()).add(module.name)
+
+    def get_module_name(self, filepath):
+        return self.files.get(os.path.abspath(filepath))
+
+    def get_dependents(self, filepath):
+        '''
+        Return file paths of the module and all modules which import it
+        directly or indirectly, empty list if the file is not in the project
+        '''
+        name = self.get_module_name(filepath)
+        if name is None:
+            return []
+        closure = set([name])
+        stack = [name]
+        while stack:
+            for dependent in self.dependents.get(stack.pop(), ()):
+                if dependent not in closure:
+                    closure.add(dependent)
+                    stack.append(dependent)
+        return [self.modules[module] for module in closure]
+
 class ScannerCommand(ConfigurationMixIn):
     """base class providing common behaviour for pyreverse commands"""
 
@@ -54,23 +113,62 @@ class ScannerCommand(ConfigurationMixIn):
         sys.path.insert(0, args[0])
         sys.path.insert(0, os.getcwd())
 
+        # changed modules and modules importing them are scanned again,
+        # results of the other modules are taken from the scan cache
+        import_graph = ImportGraph()
+        import_graph.update(scan_cache.entries.values())
+        affected = set()
+        for filepath in scan_cache.get_changed_files():
+            affected.add(filepath)
+            affected.update(import_graph.get_dependents(filepath))
+
+        # modules changed on disk since the last scan have to be parsed again
+        if hasattr(self.manager.astng_cache, 'invalidate'):
+            self.manager.astng_cache.invalidate(affected)
+
         try:
             project = self.manager.project_from_files(args, black_list= \
                     map(os.path.relpath, BlackList.blacklist))
             linker = Linker(project, tag=True)
-            handler = DiadefsHandler(self.config)
-            diadefs = handler.get_diadefs(project, linker)
+            changed = [module for module in project.modules \
+                    if module.file and (module.file in affected or \
+                    module.file not in scan_cache.entries)]
+            for module in changed:
+                linker.visit(module)
+            scan_cache.update(project.modules, changed)
+            import_graph.update(scan_cache.entries.values())
         finally:
             sys.path.pop(0)
 
-        # filter just classes (not packages) for now
-        diadefs = filter(lambda x: x.TYPE == 'class', diadefs)
+        if gsm.get(gsm.DIAGRAM_MODE) == 'packages':
+            diadefs = [scan_cache.get_package_diagram()]
+        else:
+            diadefs = [scan_cache.get_diagram()]
 
-        # update GUI
-        Gdk.threads_enter()
-        self.callback()
+        # layout is computed in this thread, canvas items are added from
+        # the main loop
+        GLib.idle_add(self.callback)
         writer.CanvasWriter(self.view, self.config).write(diadefs)
-        Gdk.threads_leave()
+
+class TogglePackage(Thread):
+
+    '''
+    Expand or collapse package of the diagram partitioned by packages,
+    classes of the package are added to or removed from the canvas
+    '''
+
+    def __init__(self, view, package):
+        super(TogglePackage, self).__init__()
+        self.view = view
+        self.package = package
+
+    def run(self):
+        # the diagram is written with the cache locked, so a scan running
+        # in the meantime doesn't mix its diagram with this one
+        with scan_cache.lock:
+            scan_cache.toggle_package(self.package)
+            writer.CanvasWriter(self.view, None).write(\
+                    [scan_cache.get_package_diagram()])
 
 class ScanProject(Thread):
 
@@ -82,5 +180,6 @@ class ScanProject(Thread):
         self.args = args
         self.callback = callback
     def run(self):
-        ScannerCommand(self.view, self.args, self.callback)
+        with scan_cache.lock:
+            ScannerCommand(self.view, self.args, self.callback)
 
@@ -35,6 +35,16 @@ class GeneralSettingsManager(SettingsManager):
     # values (name, section, default)
     EDITOR = 'editor', GENERAL_SECTION, VISUAL_EDITOR
     PROJECT_PATH = 'project_path', GENERAL_SECTION, None
+    LINT_JOBS = 'lint_jobs', GENERAL_SECTION, '1'
+    LINT_CACHE_SIZE = 'lint_cache_size', GENERAL_SECTION, '5000'
+    ASTNG_CACHE_SIZE = 'astng_cache_size', GENERAL_SECTION, '2000'
+    LIVE_LINT = 'live_lint', GENERAL_SECTION, 'off'
+    LIVE_LINT_DELAY = 'live_lint_delay', GENERAL_SECTION, '500'
+    # one of the gpylint.layout.LAYOUT_ENGINES
+    LAYOUT_ENGINE = 'layout_engine', GENERAL_SECTION, 'layered'
+    LAYOUT_TIME_BUDGET = 'layout_time_budget', GENERAL_SECTION, '2.0'
+    # 'classes' shows all classes, 'packages' shows collapsed packages
+    DIAGRAM_MODE = 'diagram_mode', GENERAL_SECTION, 'classes'
 
     def __init__(self):
 
@@ -54,15 +64,79 @@ class GeneralSettingsManager(SettingsManager):
             msgs[msg] = config.getboolean(self.PYLINT_SECTION, msg)
         return msgs
 
+    def get_lint_jobs(self):
+        '''
+        Return number of processes used for linting the whole project
+        '''
+        try:
+            return max(1, int(self.get(self.LINT_JOBS)))
+        except ValueError:
+            return 1
+
+    def get_lint_cache_size(self):
+        '''
+        Return maximal number of modules stored in the lint cache
+        '''
+        try:
+            return max(0, int(self.get(self.LINT_CACHE_SIZE)))
+        except ValueError:
+            return int(self.LINT_CACHE_SIZE[2])
+
+    def get_astng_cache_size(self):
+        '''
+        Return maximal number of parsed modules kept in memory
+        '''
+        try:
+            return max(1, int(self.get(self.ASTNG_CACHE_SIZE)))
+        except ValueError:
+            return int(self.ASTNG_CACHE_SIZE[2])
+
+    def get_live_lint(self):
+        '''
+        Return True if the code should be checked while typing
+        '''
+        name, section, default = self.LIVE_LINT
+        if config.has_option(section, name):
+            return config.getboolean(section, name)
+        return False
+
+    def get_live_lint_delay(self):
+        '''
+        Return delay in milliseconds between the last change of the buffer
+        and the check
+        '''
+        try:
+            return max(0, int(self.get(self.LIVE_LINT_DELAY)))
+        except ValueError:
+            return int(self.LIVE_LINT_DELAY[2])
+
+    def get_layout_time_budget(self):
+        '''
+        Return seconds the layout engine may spend improving the layout
+        '''
+        try:
+            return max(0., float(self.get(self.LAYOUT_TIME_BUDGET)))
+        except ValueError:
+            return float(self.LAYOUT_TIME_BUDGET[2])
+
     def code_is_ignored(self, code):
         error_type = MSG_TYPES[code[0]]
         if config.has_option(self.PYLINT_SECTION, error_type):
             return not config.getboolean(self.PYLINT_SECTION, error_type)
         return False
 
+    def get_ignored_types(self):
+        '''
+        Return set of sigles of message types disabled by Settings
+        '''
+        return set(sigle for sigle, error_type in MSG_TYPES.iteritems() \
+                if config.has_option(self.PYLINT_SECTION, error_type) and \
+                not config.getboolean(self.PYLINT_SECTION, error_type))
+
     def set(self, cname, value):
         name, section, default = cname
         config.set(section, name, value)
+        self.changed()
 
     def get(self, cname):
         name, section, default = cname
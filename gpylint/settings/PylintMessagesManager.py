@@ -5,11 +5,15 @@ Author: Jan Vorcak <vorcak@mail.muni.cz>
 '''
 
 import ConfigParser
+import cPickle as pickle
 
 from pylint.lint import PyLinter
+from pylint.__pkginfo__ import version as pylint_version
 from gpylint.settings import SettingsManager
 
 CONFIG_FILE = 'pylint_settings.ini'
+# messages of pylint checkers are cached here, see get_pylint_msgs
+MSGS_CACHE_FILE = '.pylint_msgs'
 config = ConfigParser.SafeConfigParser()
 config.read(CONFIG_FILE)
 
@@ -45,27 +49,61 @@ class PylintMessagesManager(SettingsManager):
         self.config = config
         self.CONFIG_FILE = CONFIG_FILE
 
+    def load_msgs(self):
+        '''
+        Load messages of the pylint checkers on the first use
+        Messages are read from the cache file if it was written by the same
+        pylint version, otherwise the checkers are loaded
+        '''
+        if self.msgs:
+            return
+
+        msgs = self.read_msgs_cache()
+        if msgs is None:
+            msgs = self.collect_msgs()
+            self.write_msgs_cache(msgs)
+        self.msgs.update(msgs)
+
+        for section, dictionary in self.msgs.iteritems():
+            # for each checker add section to the config
+            if not config.has_section(section):
+                config.add_section(section)
+            for code in dictionary.keys():
+                if not config.has_option(section, code):
+                    config.set(section, code, 'on')
+
+    def collect_msgs(self):
+        '''
+        Construct dictionary from the pylint checkers msgs
+        '''
         linter = PyLinter()
         linter.load_default_plugins()
         linter.read_config_file()
         linter.load_config_file()
 
+        msgs = {}
         for checkers in linter._checkers.values():
             for checker in checkers:
-
-                # for each checker add section to the config
-                if not config.has_section(checker.name):
-                    config.add_section(checker.name)
-
-                # construct dictionary from the pylint checkers msgs
-                if checker.name not in self.msgs.keys():
-                    self.msgs[checker.name] = dict()
-                self.msgs[checker.name].update(checker.msgs)
-
-        for section, dictionary in self.msgs.iteritems():
-            for code in dictionary.keys():
-                if not config.has_option(section, code):
-                    config.set(section, code, 'on')
+                msgs.setdefault(checker.name, {}).update(checker.msgs)
+        return msgs
+
+    def read_msgs_cache(self):
+        try:
+            with open(MSGS_CACHE_FILE, 'rb') as f:
+                version, msgs = pickle.load(f)
+        except (IOError, EOFError, ValueError, pickle.UnpicklingError):
+            return None
+        if version != pylint_version:
+            return None
+        return msgs
+
+    def write_msgs_cache(self, msgs):
+        try:
+            with open(MSGS_CACHE_FILE, 'wb') as f:
+                pickle.dump((pylint_version, msgs), f, \
+                        pickle.HIGHEST_PROTOCOL)
+        except IOError:
+            pass
 
     def code_is_ignored(self, code):
         '''
@@ -80,11 +118,26 @@ class PylintMessagesManager(SettingsManager):
         return False
 
     def ignore_code(self, code):
+        self.load_msgs()
         for section in config.sections():
             if config.has_option(section, code):
                 config.set(section, code, 'off')
+        self.changed()
+
+    def get_ignored_codes(self):
+        '''
+        Return set of message codes disabled by Settings
+        '''
+        codes = set()
+        for section in config.sections():
+            for code in config.options(section):
+                if not config.getboolean(section, code):
+                    # options are stored in lower case by ConfigParser
+                    codes.add(code.upper())
+        return codes
 
     def get_pylint_msgs(self):
+        self.load_msgs()
         return self.msgs
 
 
@@ -3,12 +3,19 @@ Settings Manager
 '''
 class SettingsManager(object):
 
+    # increased whenever any settings are changed
+    revision = 0
+
+    def changed(self):
+        SettingsManager.revision += 1
+
     def save_boolean(self, section, option, value):
         value = {
                     True: 'on',
                     False: 'off'
                 }[value]
         self.config.set(section, option, value)
+        self.changed()
 
     def get_boolean(self, section, option):
         return self.config.getboolean(section, option)
@@ -0,0 +1,62 @@
+"""
+Unit tests for the canvas items.
+"""
+
+import unittest
+
+import cairo
+
+from gaphas.canvas import Canvas, Context
+
+from gpylint.canvas.items import ClassBox
+
+
+class ClassBoxTestCase(unittest.TestCase):
+    """
+    Test class boxes keep their handles and ports when they are updated
+    and drawn.
+    """
+    def setUp(self):
+        self.canvas = Canvas()
+        self.box = ClassBox({'filepath': 'module.py', 'title': 'Class',
+                             'lineno': 1})
+        self.other = ClassBox({'filepath': 'module.py', 'title': 'Other',
+                               'lineno': 10})
+        self.canvas.add(self.box)
+        self.canvas.add(self.other)
+        self.box.add_moveable_handle(self.canvas, self.other)
+        self.canvas.update_now()
+
+        self.surface = cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0)
+        self.cr = cairo.Context(self.surface)
+
+    def tearDown(self):
+        self.surface.finish()
+
+    def test_update_and_draw(self):
+        """Test handles and ports aren't added by pre_update and draw"""
+        handles = len(self.box._handles)
+        ports = len(self.box._ports)
+        for i in range(10):
+            self.box.pre_update(Context(cairo=self.cr))
+            self.box.draw(Context(cairo=self.cr, hovered=False))
+            self.assertEquals(handles, len(self.box._handles))
+            self.assertEquals(ports, len(self.box._ports))
+
+    def test_central_handle(self):
+        """Test the central handle stays the same handle in the middle"""
+        central = self.box._central_handle
+        self.box.properties['title'] = 'Renamed class'
+        for i in range(3):
+            self.box.pre_update(Context(cairo=self.cr))
+            self.box.draw(Context(cairo=self.cr, hovered=False))
+        self.assertTrue(self.box._central_handle is central)
+        self.assertEquals(1, self.box._handles.count(central))
+        self.assertEquals(self.box.width / 2.0, float(central.pos.x))
+        self.assertEquals(self.box.height / 2.0, float(central.pos.y))
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:sw=4:et:ai
@@ -0,0 +1,105 @@
+"""
+Unit tests for the project linter.
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+from StringIO import StringIO
+
+from pylint.interfaces import IReporter
+from pylint.reporters import BaseReporter
+
+from gpylint.cache import lint_cache
+from gpylint.lint import IgnoreLinter, merge_stats
+
+
+class ResultsReporter(BaseReporter):
+    """
+    Reporter keeping messages and recording whether results were displayed.
+    """
+    __implements__ = IReporter
+
+    def __init__(self):
+        BaseReporter.__init__(self, StringIO())
+        self.messages = []
+        self.displayed = False
+
+    def update_progressbar(self, ratio):
+        pass
+
+    def add_message(self, msg_id, location, msg):
+        self.messages.append((msg_id, location, msg))
+
+    def display_results(self, sect):
+        self.displayed = True
+
+
+
+class LintCacheTestCase(unittest.TestCase):
+    """
+    Test checks replaying messages from the lint cache.
+    """
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filepath = os.path.join(self.dir, 'cached_module.py')
+        with open(self.filepath, 'w') as f:
+            f.write('import os\n')
+        lint_cache.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+        lint_cache.clear()
+
+    def check(self):
+        reporter = ResultsReporter()
+        linter = IgnoreLinter(reporter=reporter)
+        linter.load_default_plugins()
+        linter.config.persistent = False
+        linter.check([self.filepath])
+        return linter, reporter
+
+
+    def test_all_cached(self):
+        """Test results are displayed when all modules are cached"""
+        linter, reporter = self.check()
+        self.assertEquals(0, lint_cache.hits)
+        self.assertTrue(reporter.messages)
+
+        cached_linter, cached_reporter = self.check()
+        self.assertEquals(1, lint_cache.hits)
+        self.assertEquals(reporter.messages, cached_reporter.messages)
+        self.assertEquals(linter.base_name, cached_linter.base_name)
+        self.assertEquals(linter.stats['by_msg'], cached_linter.stats['by_msg'])
+        self.assertTrue(cached_reporter.displayed)
+
+
+
+class MergeStatsTestCase(unittest.TestCase):
+    """
+    Test statistics of the lint workers are merged.
+    """
+    def test_merge(self):
+        """Test counters are added and modules are joined"""
+        stats = {'error': 1, 'statement': 10,
+                 'by_module': {'a': {'error': 1}},
+                 'by_msg': {'E0602': 1},
+                 'dependencies': {'os': set(['a'])}}
+        merge_stats(stats, {'error': 2, 'statement': 5, 'total_lines': 7,
+                            'by_module': {'b': {'error': 2}},
+                            'by_msg': {'E0602': 1, 'E1101': 1},
+                            'dependencies': {'os': set(['b'])}})
+        self.assertEquals(3, stats['error'])
+        self.assertEquals(15, stats['statement'])
+        self.assertEquals(7, stats['total_lines'])
+        self.assertEquals({'a': {'error': 1}, 'b': {'error': 2}},
+                          stats['by_module'])
+        self.assertEquals({'E0602': 2, 'E1101': 1}, stats['by_msg'])
+        self.assertEquals(set(['a', 'b']), stats['dependencies']['os'])
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+# vim:sw=4:et:ai
@@ -1,11 +1,13 @@
 import os
-from gi.repository import Gtk
+from gi.repository import Gtk, GLib
 
 from logilab.astng.builder import MANAGER as LOGILAB_MANAGER
 
-from gpylint.lint import TextBufferLinter
+from gpylint.lint import TextBufferLinter, ProjectLinter
 from gpylint.editor import GeditEditor, VimEditor
-from gpylint.reporters import EditorReporter
+from gpylint.reporters import EditorReporter, CanvasReporter
+from gpylint.scanner import ImportGraph
+from gpylint.cache import install_astng_cache
 from gpylint.settings.PylintMessagesManager import PylintMessagesManager
 from gpylint.settings.GeneralSettingsManager import GeneralSettingsManager
 from gpylint.helpers import get_pretty_name
@@ -13,6 +15,8 @@ from gpylint.helpers import get_pretty_name
 pmm = PylintMessagesManager()
 gsm = GeneralSettingsManager()
 
+astng_cache = install_astng_cache(LOGILAB_MANAGER, gsm.get_astng_cache_size())
+
 class CodeWindow:
     '''
     Source code window
@@ -40,9 +44,14 @@ class CodeWindow:
         self._builder.connect_signals(self)
         self._filename = filename
         self._filepath = filepath
+        self._linter = None
+        self._lint_pending = False
+        self._live_lint_source = None
     
         if gsm.get(gsm.EDITOR) == gsm.VISUAL_EDITOR:
             self._editor = GeditEditor(filename, filepath, self)
+            if gsm.get_live_lint():
+                self._editor.buff.connect('changed', self.buffer_changed)
         else:
             self._editor = VimEditor(filename, filepath)
             self._button_toolbar.set_visible(False)
@@ -63,20 +72,54 @@ class CodeWindow:
         This method runs pylint agains the currently opened file
         Author: Jan Vorcak <vorcak@mail.muni.cz>
         '''
-        LOGILAB_MANAGER.astng_cache.clear()
+        if self._linter is not None:
+            # running check is superseded, the newest text is checked
+            # as soon as the running one stops
+            self._linter.cancel()
+            self._lint_pending = True
+            return
+
+        # keep parsed dependencies, just the edited module is parsed again
+        astng_cache.invalidate([self._filepath])
+        astng_cache.pop('buffer', None)
         self._editor.clear_tags()
         plugins = []
         pylintrc = None
         linter = TextBufferLinter()
-        linter.init_linter(EditorReporter(self._editor), pylintrc)
+        linter.init_linter(EditorReporter(self._editor), pylintrc, plugins)
         linter.set_scanning_items(self._scanning_label, self._spinner)
-        linter.load_default_plugins()
-        linter.load_plugin_modules(plugins)
-        linter.read_config_file()
-        linter.load_config_file()
-        linter.set_buffer(self._editor.buff)
+        linter.set_buffer(self._editor.buff, self._editor.changes)
+        linter.set_finished_callback(self.pylint_finished)
+        self._linter = linter
         linter.start()
 
+    def pylint_finished(self, linter):
+        '''
+        Show messages of the finished check, they are dropped when the
+        text was changed since the check started
+        '''
+        self._linter = None
+        if self._lint_pending:
+            self._lint_pending = False
+            self.run_pylint()
+        elif not linter.cancelled and linter.changes == self._editor.changes:
+            linter.reporter.show_messages()
+        return False
+
+    def buffer_changed(self, buff):
+        '''
+        Check the buffer when user stops typing for a while
+        '''
+        if self._live_lint_source is not None:
+            GLib.source_remove(self._live_lint_source)
+        self._live_lint_source = GLib.timeout_add(\
+                gsm.get_live_lint_delay(), self.live_lint)
+
+    def live_lint(self):
+        self._live_lint_source = None
+        self.run_pylint()
+        return False
+
     def ignore_message_clicked(self, button):
         self._error_box.set_visible(False)
         self._editor.ignore_current_tag()
@@ -89,6 +132,27 @@ class CodeWindow:
 
     def save(self, parent):
         self._editor.save()
+        self.check_dependents()
+
+    def check_dependents(self):
+        '''
+        Check the saved module and all modules importing it and update
+        errors of their classes on the canvas
+        '''
+        import_graph = ImportGraph()
+        filepaths = import_graph.get_dependents(self._filepath)
+        if not filepaths:
+            return
+        # saved module has to be parsed again
+        astng_cache.invalidate([self._filepath])
+        plugins = []
+        pylintrc = None
+        linter = ProjectLinter()
+        linter.set_modules(filepaths)
+        linter.init_linter(CanvasReporter(None, filepaths), pylintrc, \
+                plugins)
+        linter.set_use_cache(False)
+        linter.start()
 
     def set_lineno(self, lineno):
         self._editor.set_lineno(lineno)
@@ -124,6 +188,7 @@ class SettingsWindow(object):
         self._pylint_messages = self._builder.get_object('pylint_messages')
         self._visual_editor_button = self._builder.get_object('visual_editor_button')
         self._vim_editor_button = self._builder.get_object('vim_editor_button')
+        self._editor_buttons_box = self._builder.get_object('message_types_box1')
         self._window.connect("delete-event", self.exit)
 
 
@@ -137,6 +202,11 @@ class SettingsWindow(object):
         else:
             self._visual_editor_button.set_active(True)
 
+        live_lint_button = Gtk.CheckButton('Check code while typing')
+        live_lint_button.set_active(gsm.get_live_lint())
+        live_lint_button.connect('toggled', self.on_live_lint_toggled)
+        self._editor_buttons_box.add(live_lint_button)
+
         for name, messages in pmm.get_pylint_msgs().iteritems():
             self.add_section_tab(name, messages)
 
@@ -147,6 +217,10 @@ class SettingsWindow(object):
         if button.get_active():
             gsm.set(gsm.EDITOR, name)
 
+    def on_live_lint_toggled(self, button):
+        name, section, default = gsm.LIVE_LINT
+        gsm.save_boolean(section, name, button.get_active())
+
     def show_pylint_general(self, button):
         self._main_notebook.set_current_page(0)
 
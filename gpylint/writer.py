@@ -3,72 +3,282 @@
 Utilities for creating diagram on canvas
 """
 
-from logilab.common.graph import DotBackend
+import logging
+
+import cairo
+from gi.repository import Gdk, GLib
 from pylint.pyreverse.writer import DiagramWriter
-import gv
 
-from gpylint.canvas.items import ClassBox
-from gpylint.canvas import set_association, CanvasContext
+from gpylint.canvas.items import ClassBox, get_box_size
+from gpylint.canvas import set_association, remove_association, \
+        CanvasContext
+from gpylint.layout import get_layout_engine
+from gpylint.settings.GeneralSettingsManager import GeneralSettingsManager
+
+gsm = GeneralSettingsManager()
+logger = logging.getLogger('main')
+
+def get_position(item):
+    '''
+    Return position of the item's top left corner on the canvas
+    '''
+    return item.matrix[4], item.matrix[5]
+
+def get_association_key(head, tail, props):
+    '''
+    Return key of the association, associations between the same classes
+    differ by their labels (attribute names)
+    '''
+    return head, tail, props['arrowhead'], props['arrowtail'], props['label']
+
+def get_canvas_state():
+    '''
+    Return snapshot of the diagram on the canvas, it has to be called with
+    the GDK lock held
+    @return tuple (boxes, associations)
+            boxes - dictionary key => (position, layout position, width,
+                    height)
+            associations - list of association keys
+    '''
+    context = CanvasContext()
+    boxes = {}
+    for key, class_box in context.dictionary.iteritems():
+        boxes[key] = get_position(class_box), \
+                getattr(class_box, 'layout_position', None), \
+                class_box.width, class_box.height
+    return boxes, context.associations.keys()
 
-class CanvasBackend(DotBackend):
-    """ Canvas backend """
+class CanvasBackend(object):
+    """ Canvas backend, collects nodes and edges emitted by the writer """
 
-    def __init__(self, view):
-        super(CanvasBackend, self).__init__('basename')
+    # canvas items reconciled by one idle callback
+    CHUNK_SIZE = 50
+    # idle source populating the canvas, shared by all backends
+    _populate_source = None
+
+    def __init__(self, view, engine):
         self.view = view
-        self.nodes = []
+        self.engine = engine
+        # figure id => properties
+        self.nodes = {}
+        # list of (tail figure id, head figure id, properties)
         self.edges = []
-        self.graph = None
+
+    def emit_node(self, name, **props):
+        self.nodes[name] = props
+
+    def emit_edge(self, name1, name2, **props):
+        self.edges.append((name1, name2, props))
 
     def generate(self, filename):
         '''
         Displays the graph on the canvas
-        Uses python-igraph fruchterman-reingold algorithm to decide about
-        position of the nodes, then draw these nodes on the canvas and
-        draw connections between them
+        Uses the layout engine to decide about position of the nodes in the
+        calling thread, the canvas is reconciled with the diagram from the
+        main loop
         Author: Jan Vorcak <vorcak@mail.muni.cz>
         '''
+        Gdk.threads_enter()
+        try:
+            canvas_state = get_canvas_state()
+        finally:
+            Gdk.threads_leave()
+        nodes, edges = self.layout(canvas_state)
+        GLib.idle_add(self.populate, nodes, edges, canvas_state[0])
 
-        g = gv.readstring(self.source)
-        gv.layout(g, 'dot')
-        gv.render(g)
-
-        context = CanvasContext().dictionary
-
-        node = gv.firstnode(g)
-        while node is not None:
+    def layout(self, canvas_state=({}, [])):
+        '''
+        Compute position of the nodes, it doesn't touch the canvas
+        @param canvas_state - snapshot returned by get_canvas_state
+        @return tuple (nodes, edges)
+                nodes - dictionary (filepath, name, index) => (props, x,
+                        y, width, height), see diagrams.get_node_key
+                edges - list of tuples (head key, tail key, props)
+        '''
+        # boxes are measured like in ClassBox.pre_update, so they keep the
+        # size the layout counted with, the canvas may be drawn in the
+        # meantime, so a context of its own is used
+        cr = cairo.Context(cairo.ImageSurface(cairo.FORMAT_ARGB32, 0, 0))
+        keys = {}
+        sizes = {}
+        for name, values in self.nodes.iteritems():
             props = {
-                    'filepath' : gv.getv(node, 'filepath'),
-                    'title' : gv.getv(node, 'label'),
-                    'lineno' : gv.getv(node, 'lineno'),
+                    'filepath' : values.get('filepath', ''),
+                    'title' : values['label'],
+                    'name' : values.get('qualname', values['label']),
+                    'index' : values.get('index', 0),
+                    'lineno' : values.get('lineno', ''),
+                    'package' : values.get('package'),
                     }
-            pos = gv.getv(node, 'pos').split(',')
-            width = gv.getv(node, 'width')
-            height = gv.getv(node, 'height')
-            x, y = map(int, pos)
-            class_box = ClassBox(props, width, height)
-            class_box.matrix.translate(x, y)
-            self.view.canvas.add(class_box)
-            context[(props['filepath'], props['title'])] = class_box
-            node = gv.nextnode(g, node)
-
-        edge = gv.firstedge(g)
-        while edge is not None:
+            key = props['filepath'], props['name'], props['index']
+            keys[name] = key, props
+            sizes[key] = get_box_size(cr, props['title'], ClassBox.font)
+
+        edges = []
+        for tail, head, values in self.edges:
             props = {
-                    'arrowhead' : gv.getv(edge, 'arrowhead'),
-                    'arrowtail' : gv.getv(edge, 'arrowtail'),
+                    'arrowhead' : values.get('arrowhead'),
+                    'arrowtail' : values.get('arrowtail'),
+                    'label' : values.get('label'),
                     }
+            edges.append((keys[head][0], keys[tail][0], props))
 
-            head = gv.headof(edge)
-            tail = gv.tailof(edge)
-            head_str = (gv.getv(head, 'filepath'), gv.getv(head, 'label'))
-            tail_str = (gv.getv(tail, 'filepath'), gv.getv(tail, 'label'))
-            context[head_str]
-            context[tail_str]
+        # heads of the edges (e.g. base classes) are placed above tails
+        pairs = [(head, tail) for head, tail, props in edges]
+        pinned = self.get_pinned(sizes, edges, canvas_state)
+        if pinned:
+            positions = self.engine.place(sizes, pairs, pinned)
+            logger.info('Placing %d of %d classes took %.2f s' % \
+                    (len(positions), len(sizes), self.engine.elapsed))
+            positions.update(pinned)
+        else:
+            positions = self.engine.layout(sizes, pairs)
+            logger.info('Layout of %d classes took %.2f s' % \
+                    (len(sizes), self.engine.elapsed))
 
-            edge = gv.nextedge(g, edge)
-            set_association(self.view.canvas, context[head_str], \
-                    context[tail_str], props)
+        nodes = {}
+        for key, props in keys.values():
+            x, y = positions[key]
+            width, height = sizes[key]
+            nodes[key] = props, x, y, width, height
+        return nodes, edges
+
+    def get_pinned(self, sizes, edges, canvas_state):
+        '''
+        Return positions of the boxes which are already on the canvas
+        Boxes whose associations changed are placed again unless the user
+        moved them since they were placed by the layout
+        @param sizes - dictionary key => (width, height), sizes of the boxes
+                       on the canvas are updated
+        @param edges - list of tuples (head key, tail key, props)
+        @param canvas_state - snapshot returned by get_canvas_state
+        @return dictionary key => (x, y)
+        '''
+        boxes, associations = canvas_state
+        old_edges = {}
+        for edge in associations:
+            head, tail, arrowhead, arrowtail, label = edge
+            if arrowhead == 'none':
+                continue
+            old_edges.setdefault(head, set()).add(edge)
+            old_edges.setdefault(tail, set()).add(edge)
+        new_edges = {}
+        for head, tail, props in edges:
+            if props['arrowhead'] == 'none':
+                # containment edges of the expanded packages don't move
+                # the package nodes
+                continue
+            edge = get_association_key(head, tail, props)
+            new_edges.setdefault(head, set()).add(edge)
+            new_edges.setdefault(tail, set()).add(edge)
+
+        pinned = {}
+        for key in sizes:
+            if key not in boxes:
+                continue
+            position, layout_position, width, height = boxes[key]
+            changed = old_edges.get(key) != new_edges.get(key)
+            if changed and position == layout_position:
+                continue
+            pinned[key] = position
+            sizes[key] = width, height
+        return pinned
+
+    def populate(self, nodes, edges, boxes=None):
+        '''
+        Reconcile the canvas with the diagram in chunks from idle callbacks,
+        so the diagram appears progressively and the window stays
+        responsive. Population started by the previous scan is abandoned,
+        the new one reconciles the whole diagram.
+        '''
+        if CanvasBackend._populate_source is not None:
+            GLib.source_remove(CanvasBackend._populate_source)
+        CanvasBackend._populate_source = GLib.idle_add(self._populate_chunk, \
+                self.reconcile(nodes, edges, boxes))
+        return False
+
+    def _populate_chunk(self, steps):
+        for i in range(self.CHUNK_SIZE):
+            try:
+                steps.next()
+            except StopIteration:
+                CanvasBackend._populate_source = None
+                return False
+        return True
+
+    def reconcile(self, nodes, edges, boxes=None):
+        '''
+        Update the canvas so it matches the diagram, it's a generator
+        yielding after every changed canvas item
+        Only missing boxes and associations are added, boxes and
+        associations which are not in the diagram anymore are removed.
+        Boxes which are already on the canvas are moved only if the layout
+        placed them again and the user didn't move them since the layout
+        started.
+        @param nodes - nodes returned by layout
+        @param edges - edges returned by layout
+        @param boxes - boxes of the snapshot the layout was computed from,
+                       see get_canvas_state
+        '''
+        if boxes is None:
+            boxes = {}
+        canvas = self.view.canvas
+        context = CanvasContext().dictionary
+        names = CanvasContext().names
+        associations = CanvasContext().associations
+
+        new_associations = {}
+        for head_str, tail_str, props in edges:
+            key = get_association_key(head_str, tail_str, props)
+            new_associations[key] = head_str, tail_str, props
+
+        # associations go first, so they are removed before their boxes
+        for key in associations.keys():
+            if key not in new_associations:
+                remove_association(canvas, associations.pop(key))
+                yield
+
+        for key in context.keys():
+            if key not in nodes:
+                class_box = context.pop(key)
+                if names.get(key[:2]) is class_box:
+                    del names[key[:2]]
+                class_box.clear_errors()
+                canvas.remove(class_box)
+                yield
+
+        for key, (props, x, y, width, height) in nodes.iteritems():
+            class_box = context.get(key)
+            if class_box is None:
+                class_box = ClassBox(props, width, height)
+                class_box.matrix.translate(x, y)
+                class_box.layout_position = get_position(class_box)
+                canvas.add(class_box)
+                context[key] = class_box
+                names[key[:2]] = class_box
+                yield
+            else:
+                old_x, old_y = get_position(class_box)
+                if key in boxes:
+                    start = boxes[key][0]
+                else:
+                    start = getattr(class_box, 'layout_position', None)
+                # boxes moved by the user while the layout was running
+                # stay where they are
+                if (old_x, old_y) == start and (old_x, old_y) != (x, y):
+                    class_box.matrix.translate(x - old_x, y - old_y)
+                    class_box.layout_position = get_position(class_box)
+                    canvas.request_matrix_update(class_box)
+                    yield
+                if class_box.properties != props:
+                    class_box.properties.update(props)
+                    class_box.request_update()
+
+        for key, (head_str, tail_str, props) in new_associations.iteritems():
+            if key not in associations:
+                associations[key] = set_association(canvas, \
+                        context[head_str], context[tail_str], props)
+                yield
 
 
 class CanvasWriter(DiagramWriter):
@@ -83,11 +293,37 @@ class CanvasWriter(DiagramWriter):
                   dict(fontcolor='green', arrowtail='none',
                        arrowhead='diamond', style='solid') ]
         DiagramWriter.__init__(self, config, styles)
+        self.contains_edges = dict(arrowtail='none', arrowhead='none')
+
+    def write(self, diadefs):
+        '''
+        Write class diagrams on the canvas, config is used only by the file
+        based writers, so it may be None
+        '''
+        for diagram in diadefs:
+            self.set_printer(diagram.title, diagram.title)
+            self.write_classes(diagram)
+            self.close_graph()
+
+    def write_classes(self, diagram):
+        '''
+        Write classes and relationships of the diagram, dependencies of the
+        package nodes and their classes are written too
+        '''
+        DiagramWriter.write_classes(self, diagram)
+        for rel in diagram.get_relationships('depends'):
+            self.printer.emit_edge(rel.from_object.fig_id, \
+                    rel.to_object.fig_id, **self.pkg_edges)
+        for rel in diagram.get_relationships('contains'):
+            self.printer.emit_edge(rel.from_object.fig_id, \
+                    rel.to_object.fig_id, **self.contains_edges)
 
     def set_printer(self, file_name, basename):
         """initialize CanvasBackend and add options for layout.
         """
-        self.printer = CanvasBackend(self.canvas)
+        engine = get_layout_engine(gsm.get(gsm.LAYOUT_ENGINE), \
+                gsm.get_layout_time_budget())
+        self.printer = CanvasBackend(self.canvas, engine)
         self.file_name = file_name
 
     def get_title(self, obj):
@@ -101,10 +337,15 @@ class CanvasWriter(DiagramWriter):
 
         d = dict()
         d['label'] = obj.title
+        # name qualified within the module, emit_node takes name already
+        d['qualname'] = obj.name
+        d['index'] = obj.index
 
-        if obj.shape == 'class' and hasattr(obj.node.parent, 'file'):
-            d['filepath'] = obj.node.parent.file
-            d['lineno'] = obj.node.lineno
+        if obj.shape == 'class' and obj.filepath:
+            d['filepath'] = obj.filepath
+            d['lineno'] = obj.lineno
+        elif obj.shape == 'package':
+            d['package'] = obj.title
 
         return d
 
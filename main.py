@@ -25,6 +25,8 @@ from gaphas.tool import ToolChain, HoverTool, ConnectHandleTool, PanTool, \
 from gpylint.editor import ignored_tags
 from gpylint.scanner import ScanProject, BlackList
 from gpylint.lint import ProjectLinter
+from gpylint.cache import lint_cache
+from gpylint.diagrams import scan_cache
 from gpylint.reporters import CanvasReporter
 from gpylint.canvas.tools import OpenEditorTool
 from gpylint.windows import WindowManager, SettingsWindow
@@ -59,6 +61,11 @@ try:
 except IOError:
     pass
 
+lint_cache.set_max_entries(gsm.get_lint_cache_size())
+lint_cache.load()
+logger.info('Loaded lint cache %s' % lint_cache.get_stats())
+scan_cache.load()
+
 class Window:
     '''
     This class maps actions from xml to it's methods
@@ -188,11 +195,8 @@ class Window:
         plugins = []
         linter = ProjectLinter()
         linter.set_project_path(self.project_path)
-        linter.init_linter(CanvasReporter(self.scanning_bar), pylintrc)
-        linter.load_default_plugins()
-        linter.load_plugin_modules(plugins)
-        linter.read_config_file()
-        linter.load_config_file()
+        linter.set_jobs(gsm.get_lint_jobs())
+        linter.init_linter(CanvasReporter(self.scanning_bar), pylintrc, plugins)
         linter.start()
 
     def ignore_file(self, event):
@@ -222,9 +226,8 @@ class Window:
 
 
     def refresh_clicked(self, button):
+        # canvas is reconciled with the new diagram by the CanvasWriter
         self.canvas_area.set_current_page(0)
-        for item in self.view.canvas.get_all_items():
-            self.view.canvas.remove(item)
         t=ScanProject(self.view, [self.project_path], self.show_graph)
         t.start()
 
@@ -341,6 +344,9 @@ class Window:
         with open('.ignored_files', 'w') as f:
             pickle.dump(BlackList.blacklist, f)
 
+        lint_cache.save()
+        scan_cache.save()
+
         gsm.save()
         pmm.save()
 